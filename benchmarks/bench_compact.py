@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark the memory and pickling cost of comparison results held as dicts
+keyed by Package against the columnar CompactResult.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_compact
+"""
+
+import pickle
+import time
+import tracemalloc
+
+from benchmarks.corpus import generate_packages
+from compare_reqs import CompactResult, _classify_packages, _iter_classified
+
+CASES = [(100, 500), (500, 500), (1000, 1000)]
+
+
+def measure(build):
+    """
+    Memory allocated while building results, pickled size and pickle round
+    trip time.
+    """
+    tracemalloc.start()
+    results = build()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    pickle.loads(pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL))
+    round_trip = time.perf_counter() - start
+    return allocated, len(pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL)), round_trip
+
+
+def main():
+    print(f'{"files":>6} {"packages":>9} {"results":>8} {"memory MiB":>11} {"pickle MiB":>11} {"round trip":>11}')
+    for file_count, packages_per_file in CASES:
+        packages = generate_packages(file_count, packages_per_file)
+        for label, build in (
+            ('dicts', lambda: _classify_packages(packages)),
+            ('compact', lambda: CompactResult.from_records(_iter_classified(packages))),
+        ):
+            allocated, pickled, round_trip = measure(build)
+            print(f'{file_count:>6} {packages_per_file:>9} {label:>8} {allocated / 2 ** 20:>11.2f} '
+                  f'{pickled / 2 ** 20:>11.2f} {round_trip:>10.3f}s')
+
+
+if __name__ == '__main__':
+    main()
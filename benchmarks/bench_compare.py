@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark the package comparison engine as the number of requirements files
+grows.  Packages are generated in memory so only classification is measured.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_compare
+"""
+
+import time
+from collections import defaultdict
+
+from benchmarks.corpus import generate_packages
+from compare_reqs import _classify_packages
+
+FILE_COUNTS = [2, 10, 50, 100, 200, 500, 1000]
+PACKAGES_PER_FILE = 500
+LEGACY_MAX_FILES = 10
+
+
+def legacy_classify(packages):
+    """
+    The nested scan the engine replaced, kept here as a reference point.
+    """
+    unique_packages = defaultdict(list)
+    diff_packages = defaultdict(list)
+    same_packages = defaultdict(list)
+
+    for filepath, package_set in packages.items():
+        for package in package_set:
+            found, is_same_package = False, False
+            for filepath2, package_set2 in packages.items():
+                if filepath == filepath2:
+                    continue
+                for package2 in package_set2:
+                    if package == package2:
+                        found = True
+                        is_same_package = True
+                    elif package.name == package2.name:
+                        found = True
+                        is_same_package = False
+                        diff_packages[package].append(filepath)
+                        break
+                if found and not is_same_package:
+                    break
+
+            if found and is_same_package:
+                same_packages[package].append(filepath)
+            elif not found:
+                unique_packages[package].append(filepath)
+
+    return diff_packages, unique_packages, same_packages
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f'{"files":>6} {"packages":>9} {"indexed (s)":>12} {"nested (s)":>11}')
+    for file_count in FILE_COUNTS:
+        packages = generate_packages(file_count, PACKAGES_PER_FILE)
+        total = file_count * PACKAGES_PER_FILE
+        indexed = timed(_classify_packages, packages)
+        legacy = '-'
+        if file_count <= LEGACY_MAX_FILES:
+            legacy = f'{timed(legacy_classify, packages):.3f}'
+        print(f'{file_count:>6} {total:>9} {indexed:>12.3f} {legacy:>11}')
+
+
+if __name__ == '__main__':
+    main()
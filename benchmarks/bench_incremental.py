@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark an incremental rerun against a full comparison after editing a
+single file out of many.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_incremental [files] [packages per file]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import write_corpus
+from compare_reqs import SnapshotStore, _compare_reqs
+
+DEFAULT_FILES = 500
+DEFAULT_PACKAGES = 300
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES
+    packages_per_file = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PACKAGES
+    directory = tempfile.mkdtemp()
+    try:
+        filepaths = write_corpus(directory, file_count, packages_per_file)
+        store = SnapshotStore()
+
+        print(f'full comparison:      {timed(_compare_reqs, *filepaths):8.3f}s')
+        print(f'first snapshot run:   {timed(_compare_reqs, *filepaths, snapshot=store):8.3f}s')
+        print(f'unchanged rerun:      {timed(_compare_reqs, *filepaths, snapshot=store):8.3f}s')
+
+        with open(filepaths[0], 'a') as f:
+            f.write('package-edited==9.9.9\n')
+        os.utime(filepaths[0], ns=(1, 1))
+        print(f'rerun after one edit: {timed(_compare_reqs, *filepaths, snapshot=store):8.3f}s')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
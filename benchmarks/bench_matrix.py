@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Benchmark the pairwise drift matrix as the number of requirements files grows,
+against running a separate comparison for every pair of files.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_matrix
+"""
+
+import itertools
+import time
+
+from benchmarks.corpus import generate_packages
+from compare_reqs import _classify_packages, _drift_matrix
+
+FILE_COUNTS = [10, 50, 100, 200, 500, 1000]
+PACKAGES_PER_FILE = 300
+PAIRWISE_MAX_FILES = 50
+
+
+def pairwise(packages):
+    """
+    One comparison per pair of files, the approach the matrix replaces.
+    """
+    for left, right in itertools.combinations(packages, 2):
+        _classify_packages({left: packages[left], right: packages[right]})
+
+
+def main():
+    print(f'{"files":>6} {"matrix":>10} {"pairwise":>10}')
+    for file_count in FILE_COUNTS:
+        packages = generate_packages(file_count, PACKAGES_PER_FILE)
+
+        start = time.perf_counter()
+        _drift_matrix(packages, jaccard=True)
+        matrix_s = time.perf_counter() - start
+
+        pairwise_s = ''
+        if file_count <= PAIRWISE_MAX_FILES:
+            start = time.perf_counter()
+            pairwise(packages)
+            pairwise_s = f'{time.perf_counter() - start:.3f}s'
+        print(f'{file_count:>6} {matrix_s:>9.3f}s {pairwise_s:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Peak memory benchmark for reading very large frozen requirements files.  Each
+reader runs in its own process so its peak resident set size can be compared:
+the readlines based reader grows with the file, the streaming and memory
+mapped readers should stay flat.
+
+Run from the repository root (size in MiB, default 300):
+
+    python -m benchmarks.bench_mmap [size]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from compare_reqs import _file_digest, iter_requirements
+
+DEFAULT_SIZE_MB = 300
+READERS = ('readlines', 'lines', 'mmap', 'digest')
+
+
+def write_corpus(path, size_mb):
+    """
+    Write a pip-compile style file, package lines followed by indented hash
+    lines and comments, until it reaches size_mb.
+    """
+    target = size_mb * 1024 * 1024
+    block = []
+    for idx in range(1000):
+        block.append(f'package-{idx}==1.{idx % 50}.0 \\\n')
+        block.append(f'    --hash=sha256:{idx:064x}\n')
+        block.append(f'    # via service-{idx % 7}\n')
+    block = ''.join(block).encode()
+
+    with open(path, 'wb') as f:
+        written = 0
+        while written < target:
+            f.write(block)
+            written += len(block)
+
+
+def run_reader(reader, path):
+    start = time.perf_counter()
+    if reader == 'readlines':
+        with open(path, 'r') as f:
+            count = sum(1 for line in f.readlines() if line[:1].isalpha())
+    elif reader == 'digest':
+        _file_digest(path)
+        count = 0
+    else:
+        count = sum(1 for _ in iter_requirements(path, use_mmap=reader == 'mmap'))
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    print(f'{reader:<10} {elapsed:>8.2f}s {peak_mb:>10.1f} MiB {count:>10} packages')
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--reader':
+        run_reader(sys.argv[2], sys.argv[3])
+        return
+
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE_MB
+    fd, path = tempfile.mkstemp(suffix='-requirements.txt')
+    os.close(fd)
+    try:
+        write_corpus(path, size_mb)
+        print(f'{size_mb} MiB file')
+        for reader in READERS:
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_mmap', '--reader', reader, path], check=True)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Memory and sorting benchmark for Package over a 100k package corpus, compared
+with the previous frozen dataclass that parsed versions on every comparison.
+Exits with an error when Package needs more memory than the dataclass.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_package [packages]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from packaging import version
+
+from compare_reqs import Package
+
+DEFAULT_PACKAGES = 100000
+
+
+@dataclass(frozen=True)
+class LegacyPackage:
+    name: str
+    version: str = None
+    version_spec: str = None
+
+    def __gt__(self, other):
+        if self.name != other.name:
+            return self.name > other.name
+        if not all((self.version, other.version)):
+            if self.version is None and other.version is not None:
+                return True
+        else:
+            self_version_parsed = version.parse(self.version)
+            other_version_parsed = version.parse(other.version)
+            if self_version_parsed != other_version_parsed:
+                return self_version_parsed > other_version_parsed
+            if self.version_spec != other.version_spec:
+                return self.version_spec > other.version_spec
+        return False
+
+    def __lt__(self, other):
+        return not self >= other
+
+    def __ge__(self, other):
+        return self > other or self == other
+
+
+def make_rows(count, seed=0):
+    """
+    Rows as they come out of the parser, fresh strings for every line with a
+    few hundred distinct names and versions repeated across them.
+    """
+    rng = random.Random(seed)
+    return [
+        (f'package-{rng.randint(0, 500)}', f'{rng.randint(0, 5)}.{rng.randint(0, 20)}.0', '==')
+        for _ in range(count)
+    ]
+
+
+def measure(package_class, rows):
+    tracemalloc.start()
+    packages = [package_class(''.join(name), ''.join(version_str), spec) for name, version_str, spec in rows]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    sorted(packages)
+    elapsed = time.perf_counter() - start
+
+    keyed = None
+    if hasattr(package_class, 'sort_key'):
+        start = time.perf_counter()
+        sorted(packages, key=lambda package: package.sort_key)
+        keyed = time.perf_counter() - start
+    return peak, elapsed, keyed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PACKAGES
+    rows = make_rows(count)
+    print(f'{"class":<15} {"peak MiB":>9} {"sort (s)":>9} {"key sort (s)":>13}')
+    peaks = {}
+    for package_class in (LegacyPackage, Package):
+        peak, elapsed, keyed = measure(package_class, rows)
+        peaks[package_class] = peak
+        keyed = '-' if keyed is None else f'{keyed:.3f}'
+        print(f'{package_class.__name__:<15} {peak / 2 ** 20:>9.1f} {elapsed:>9.3f} {keyed:>13}')
+
+    if peaks[Package] > peaks[LegacyPackage]:
+        sys.exit(f'Package needs more memory than {LegacyPackage.__name__}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark requirements parsing throughput in lines per second, comparing the
+streaming parser with the previous readlines based implementation.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_parse [lines]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from compare_reqs import SPECIFIERS, Package, iter_requirements, parse_requirements
+
+DEFAULT_LINES = 200000
+
+
+def write_corpus(path, lines, seed=0):
+    """
+    Write a synthetic frozen requirements file with comments and blank lines
+    mixed in, similar to a monorepo freeze.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        for idx in range(lines):
+            roll = rng.random()
+            if roll < 0.05:
+                f.write('# generated by pip freeze\n')
+            elif roll < 0.08:
+                f.write('\n')
+            elif roll < 0.15:
+                f.write(f'package-{idx}\n')
+            else:
+                spec = rng.choice(['==', '>=', '~='])
+                f.write(f'package-{idx}{spec}{rng.randint(0, 9)}.{rng.randint(0, 99)}.0\n')
+
+
+def legacy_parse_requirements(filepath):
+    """
+    The per-character parser the streaming parser replaced, kept here as a
+    reference point.
+    """
+    with open(filepath, 'r') as f:
+        data = []
+        for line in f.readlines():
+            if line != '\n' and line[0].isalpha():
+                data.append(line.strip())
+
+    packages = set([])
+    for package_str in data:
+        deliminated = False
+        for idx, char in enumerate(package_str):
+            if char in SPECIFIERS:
+                deliminated = True
+                if package_str[idx + 1] in SPECIFIERS:
+                    char = char + package_str[idx + 1]
+                module = package_str.split(char)
+                module_data = {'name': module[0]}
+                if len(module) > 1:
+                    module_data.update({'version_spec': char, 'version': module[1]})
+                packages.add(Package(**module_data))
+                break
+        if not deliminated:
+            packages.add(Package(name=package_str))
+
+    return tuple(packages)
+
+
+def consume(filepath):
+    for _ in iter_requirements(filepath):
+        pass
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES
+    fd, path = tempfile.mkstemp(suffix='-requirements.txt')
+    os.close(fd)
+    try:
+        write_corpus(path, lines)
+        for label, func in [('legacy', legacy_parse_requirements),
+                            ('parse_requirements', parse_requirements),
+                            ('iter_requirements', consume)]:
+            start = time.perf_counter()
+            func(path)
+            elapsed = time.perf_counter() - start
+            print(f'{label:<20} {elapsed:8.3f}s {lines / elapsed:>12,.0f} lines/s')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Synthetic requirements corpus shared by the benchmarks.
+
+Every file lists ``packages_per_file`` packages.  ``overlap`` is the fraction
+of them drawn from a core set shared by all files, the rest are sampled from a
+larger pool so they only partially overlap between files.  ``drift`` is the
+probability that a shared package is pinned to a different version than the
+core version in a given file.
+"""
+
+import os
+import random
+
+from compare_reqs import Package
+
+
+def generate_requirements(file_count, packages_per_file, overlap=0.8, drift=0.1, seed=0):
+    """
+    Generate requirement lines per file.
+
+    # return: (generator) (file index, list of (name, version_spec, version))
+    """
+    rng = random.Random(seed)
+    shared_count = int(packages_per_file * overlap)
+    shared = [
+        (f'shared-package-{idx}', f'{rng.randint(0, 9)}.{rng.randint(0, 30)}.0')
+        for idx in range(shared_count)
+    ]
+    pool = [f'package-{idx}' for idx in range(max(packages_per_file - shared_count, 1) * 4)]
+
+    for file_idx in range(file_count):
+        requirements = []
+        for name, core_version in shared:
+            if rng.random() < drift:
+                requirements.append((name, '==', f'{rng.randint(0, 9)}.{rng.randint(31, 60)}.0'))
+            else:
+                requirements.append((name, '==', core_version))
+
+        for name in rng.sample(pool, packages_per_file - shared_count):
+            requirements.append((name, rng.choice(['==', '>=', '~=']), f'1.{rng.randint(0, 3)}.0'))
+
+        rng.shuffle(requirements)
+        yield file_idx, requirements
+
+
+def generate_packages(file_count, packages_per_file, overlap=0.8, drift=0.1, seed=0):
+    """
+    Build the corpus in memory as parsed packages, skipping files and parsing.
+
+    # return: (dict) filepath -> tuple of packages
+    """
+    return {
+        f'service-{file_idx}/requirements.txt': tuple(
+            Package(name, version, version_spec) for name, version_spec, version in requirements
+        )
+        for file_idx, requirements in generate_requirements(file_count, packages_per_file, overlap, drift, seed)
+    }
+
+
+def write_corpus(directory, file_count, packages_per_file, overlap=0.8, drift=0.1, seed=0):
+    """
+    Write the corpus as requirements files, with a few comments and blank
+    lines mixed in as real files have.
+
+    # return: (list) written filepaths in file order
+    """
+    filepaths = []
+    for file_idx, requirements in generate_requirements(file_count, packages_per_file, overlap, drift, seed):
+        filepath = os.path.join(directory, f'service-{file_idx}-requirements.txt')
+        with open(filepath, 'w') as f:
+            f.write(f'# requirements for service {file_idx}\n\n')
+            for name, version_spec, version in requirements:
+                f.write(f'{name}{version_spec}{version}\n')
+        filepaths.append(filepath)
+    return filepaths
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite timing the parse, classify and render stages separately over
+a synthetic corpus, emitting JSON so results can be tracked over time.  Runs
+entirely on local files.
+
+Run from the repository root:
+
+    python -m benchmarks.run --preset quick
+    python -m benchmarks.run --files 2 200 2000 --packages 10 1000 --overlap 0.5 --output results.json
+"""
+
+import argparse
+import io
+import itertools
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import write_corpus
+from compare_reqs import (
+    __version__, _classify_packages, _package, _parse_pep508, _parse_version, _print_table, canonical_name,
+    parse_requirements,
+)
+
+PRESETS = {
+    'quick': {'files': [2, 20, 200], 'packages': [10, 1000]},
+    'full': {'files': [2, 20, 200, 2000], 'packages': [10, 100, 1000, 10000]},
+}
+# largest number of package lines a single case may generate unless --max-lines is given
+MAX_LINES = 2_000_000
+# memoized parsing helpers, cleared between repeats so every run parses cold
+CACHES = (_package, _parse_pep508, _parse_version, canonical_name)
+
+
+def clear_caches():
+    for cache in CACHES:
+        cache.cache_clear()
+
+
+def time_stage(func, *args, repeat=1):
+    """
+    Best wall time over repeat runs, along with the last result.  Parse caches
+    are cleared before each run so repeats are not warmed by earlier ones.
+    """
+    best, result = None, None
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def parse_all(filepaths):
+    return {filepath: parse_requirements(filepath) for filepath in filepaths}
+
+
+def render(results):
+    _print_table(*results, show_diff_versions=True, show_unique=True, show_same=True,
+                 remove_spaces=False, stream=io.StringIO())
+
+
+def run_case(file_count, packages_per_file, overlap, drift, repeat, seed):
+    directory = tempfile.mkdtemp()
+    try:
+        filepaths = write_corpus(directory, file_count, packages_per_file, overlap, drift, seed)
+        parse_s, packages = time_stage(parse_all, filepaths, repeat=repeat)
+        classify_s, results = time_stage(_classify_packages, packages, repeat=repeat)
+        render_s, _ = time_stage(render, results, repeat=repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    return {
+        'files': file_count,
+        'packages_per_file': packages_per_file,
+        'overlap': overlap,
+        'drift': drift,
+        'lines': file_count * packages_per_file,
+        'parse_s': parse_s,
+        'classify_s': classify_s,
+        'render_s': render_s,
+        'diff': len(results[0]),
+        'unique': len(results[1]),
+        'same': len(results[2]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--files', type=int, nargs='+', help='file counts, overrides the preset')
+    parser.add_argument('--packages', type=int, nargs='+', help='packages per file, overrides the preset')
+    parser.add_argument('--overlap', type=float, nargs='+', default=[0.8])
+    parser.add_argument('--drift', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-lines', type=int, default=MAX_LINES,
+                        help='skip cases generating more package lines than this')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    # warm lazily imported dependencies so they are not timed in the first case
+    render(_classify_packages({}))
+
+    file_counts = args.files or PRESETS[args.preset]['files']
+    package_counts = args.packages or PRESETS[args.preset]['packages']
+    cases = []
+    for file_count, packages_per_file, overlap, drift in itertools.product(
+            file_counts, package_counts, args.overlap, args.drift):
+        if file_count * packages_per_file > args.max_lines:
+            print(f'{file_count:>5} files x {packages_per_file:>5} packages: skipped, more than '
+                  f'{args.max_lines} lines', file=sys.stderr)
+            continue
+        case = run_case(file_count, packages_per_file, overlap, drift, args.repeat, args.seed)
+        print(f'{file_count:>5} files x {packages_per_file:>5} packages: parse {case["parse_s"]:.3f}s '
+              f'classify {case["classify_s"]:.3f}s render {case["render_s"]:.3f}s', file=sys.stderr)
+        cases.append(case)
+
+    report = {
+        'compare_reqs': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'cases': cases,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
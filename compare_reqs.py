@@ -1,12 +1,29 @@
 #!/usr/bin/env python3
 
+import fnmatch
+import functools
+import glob
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
 import os
-import urllib.request
+import pickle
+import re
+import string
+import sys
+import threading
+import time
+import urllib.parse
+from array import array
 from collections import defaultdict
-from dataclasses import dataclass
+from contextlib import contextmanager, nullcontext
 
-from art import tprint
-from packaging import version
+# art, packaging and the heavier standard library modules (http.client,
+# urllib.request, concurrent.futures, csv, asyncio) are imported only on the
+# code paths that use them, so callers that just want the raw comparison
+# results do not pay for importing them
 
 __version__ = '0.1.0'
 __date__ = '2023-01-16'
@@ -16,86 +33,526 @@ __licence__ = 'BSD'
 REQUIREMENTS_TXT = 'requirements.txt'
 REQUIREMENTS = 'requirements'
 
+# downloaded requirements are cached here unless overridden by the environment
+CACHE_DIR_ENV = 'COMPARE_REQS_CACHE_DIR'
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+DEFAULT_TIMEOUT = 30
+MAX_REDIRECTS = 5
+
+# sources read directly into packages rather than from a requirements file:
+# the running interpreter's distributions, another environment's and stdin
+INSTALLED_SOURCE = 'installed:'
+VENV_SOURCE = 'venv:'
+STDIN_SOURCE = '-'
+STDIN_LABEL = '<stdin>'
+
+# the async API bounds work in flight overall and connections per host
+DEFAULT_CONCURRENCY = 16
+DEFAULT_HOST_CONNECTIONS = 4
+
+# memory mapped files are scanned in windows whose pages are released once
+# scanned so resident memory stays flat however large the file is
+MMAP_WINDOW = 16 * 1024 * 1024
+
 # For the dependency identifier specification, see
 # https://www.python.org/dev/peps/pep-0508/#complete-grammar
 # https://www.python.org/dev/peps/pep-0440/#version-specifiers
 # arbitrary equality operator is ignored at this time
 SPECIFIERS = ["<", ">", "=", "!", "~"]
 
+# name, optional one or two character specifier and version, then any per
+# requirement options such as --hash, a line continuation and an inline
+# comment, as pip-compile --generate-hashes writes them
+_SPECIFIER_CHARS = re.escape(''.join(SPECIFIERS))
+_REQUIREMENT_RE = re.compile(
+    rf'([^{_SPECIFIER_CHARS}\s]+)\s*(?:([{_SPECIFIER_CHARS}]{{1,2}})\s*([^#]*?))?'
+    r'(?:\s+--[^#]*?)?\s*\\?\s*(?:#.*)?$'
+)
+
+# inline comments, per requirement options such as --hash and a trailing
+# line continuation, stripped before PEP 508 parsing which allows none of them
+_TRAILING_OPTIONS_RE = re.compile(r'(?:(?:^|\s+)(?:#|--).*|\s*\\)$')
+
+# -r/--requirement and -c/--constraint options including another file, the
+# short forms may be glued to their target as pip allows
+REQUIREMENT_INCLUDE = 'requirement'
+CONSTRAINT_INCLUDE = 'constraint'
+_INCLUDE_KINDS = {
+    '-r': REQUIREMENT_INCLUDE, '--requirement': REQUIREMENT_INCLUDE,
+    '-c': CONSTRAINT_INCLUDE, '--constraint': CONSTRAINT_INCLUDE,
+}
+_INCLUDE_PATTERN = r'(-[rc]|--requirement(?=[\s=])|--constraint(?=[\s=]))[ \t]*=?[ \t]*([^\s#]+)'
+_INCLUDE_RE = re.compile(_INCLUDE_PATTERN)
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_version(version_str):
+    """
+    Parse a version string once, sharing the result between every package
+    pinning the same version.
+
+    # param version_str: (str) version string
+    # return: (Version) parsed version or None if it is not a valid version
+    """
+    from packaging import version
+
+    try:
+        return version.parse(version_str)
+    except version.InvalidVersion:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _specifier_set(specifier):
+    """
+    Compile a specifier once, sharing it between every package using it.
+
+    # param specifier: (str) comma separated version specifiers
+    # return: (SpecifierSet) compiled specifiers or None if they are not valid
+    """
+    from packaging.specifiers import InvalidSpecifier, SpecifierSet
+
+    try:
+        return SpecifierSet(specifier)
+    except InvalidSpecifier:
+        return None
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
+_NAME_SEPARATORS_RE = re.compile(r'[-_.]+')
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def canonical_name(name):
+    """
+    Normalize a package name as described in PEP 503, so that for example
+    ``Django`` and ``django`` or ``zope_interface`` and ``zope.interface``
+    name the same package.
+
+    # param name: (str) package name as written
+    # return: (str) normalized name
+    """
+    return sys.intern(_NAME_SEPARATORS_RE.sub('-', name).lower())
+
 
-@dataclass(frozen=True)
 class Package:
-    name: str
-    version: str = None
-    version_spec: str = None
+    """
+    A single requirement.  Uses slots and interned strings to keep large
+    comparisons small, and orders packages by a sort key computed once per
+    package from cached parsed versions.
+
+    The name is kept as written, canonical_name is what packages are matched
+    and grouped on and pin is everything besides the name that has to match
+    for two packages to be the same.
+
+    A single clause specifier is split into version_spec and version.  Multi
+    clause specifiers from the PEP 508 parser are kept whole and normalized in
+    version_spec, e.g. '<2.0,>=1.0', with version left unset.  Extras are kept
+    as a sorted tuple of normalized names and markers as normalized strings.
+    Only the PEP 508 parser produces them, so packages with extras or a marker
+    are _MarkedPackage instances and all others have no slots for either.
+    """
+    __slots__ = ('name', 'version', 'version_spec', 'canonical_name', '_hash', '_sort_key')
+
+    extras = ()
+    marker = None
+
+    def __new__(cls, name, version=None, version_spec=None, extras=(), marker=None):
+        if extras or marker is not None:
+            cls = _MarkedPackage
+        return object.__new__(cls)
+
+    def __init__(self, name, version=None, version_spec=None, extras=(), marker=None):
+        object.__setattr__(self, 'name', sys.intern(name))
+        object.__setattr__(self, 'version', _intern(version))
+        object.__setattr__(self, 'version_spec', _intern(version_spec))
+        if extras or marker is not None:
+            object.__setattr__(self, 'extras', tuple(extras))
+            object.__setattr__(self, 'marker', _intern(marker))
+        object.__setattr__(self, 'canonical_name', canonical_name(self.name))
+        object.__setattr__(self, '_hash', hash((self.name,) + self.pin))
+        object.__setattr__(self, '_sort_key', None)
+
+    @property
+    def pin(self):
+        """
+        Version, specifier, extras and marker, built when asked for as most
+        packages are only ever hashed and compared field by field.
+        """
+        return self.version, self.version_spec, self.extras, self.marker
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'cannot assign to field {name!r}')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'cannot delete field {name!r}')
+
+    def __reduce__(self):
+        return Package, (self.name, self.version, self.version_spec, self.extras, self.marker)
+
+    def __repr__(self):
+        optional = ''
+        if self.extras:
+            optional += f', extras={self.extras!r}'
+        if self.marker is not None:
+            optional += f', marker={self.marker!r}'
+        return f'Package(name={self.name!r}, version={self.version!r}, version_spec={self.version_spec!r}{optional})'
 
     def __str__(self):
+        package_str = self.name
+        if self.extras:
+            package_str += f'[{",".join(self.extras)}]'
         if self.version_spec and self.version:
-            return f'{self.name} {self.version_spec} {self.version}'
-        return self.name
+            package_str += f' {self.version_spec} {self.version}'
+        elif self.version_spec:
+            package_str += f' {self.version_spec}'
+        if self.marker:
+            package_str += f'; {self.marker}'
+        return package_str
+
+    def __hash__(self):
+        return self._hash
+
+    @property
+    def sort_key(self):
+        """
+        Orders by canonical name, then parsed version with unversioned packages
+        last, then specifier and spelling.  Versions that cannot be parsed sort
+        after valid ones.
+        """
+        if self._sort_key is None:
+            if self.version is None:
+                version_key = (True, False, ())
+            else:
+                parsed = _parse_version(self.version)
+                version_key = (False, True, self.version) if parsed is None else (False, False, parsed)
+            sort_key = (self.canonical_name,) + version_key + (
+                self.version_spec or '', self.version or '', self.name, self.extras, self.marker or ''
+            )
+            object.__setattr__(self, '_sort_key', sort_key)
+        return self._sort_key
+
+    @property
+    def specifier(self):
+        """
+        Compiled SpecifierSet of the version constraints, None for unversioned
+        packages or specifiers that are not valid.
+        """
+        if not self.version_spec:
+            return None
+        return _specifier_set(self.version_spec + (self.version or ''))
 
     def _can_compare(self, other):
         if not isinstance(other, Package):
             raise TypeError(f'Cannot compare {type(self)} with {type(other)}')
 
     def __ne__(self, other):
-        self._can_compare(other)
-        return self.name != other.name or \
-            self.version != other.version or \
-            self.version_spec != other.version_spec
+        return not self == other
 
     def __eq__(self, other):
+        if self is other:
+            return True
         self._can_compare(other)
-        return self.name == other.name and \
-            self.version == other.version and \
-            self.version_spec == other.version_spec
+        return (
+            self.name == other.name and self.version == other.version and self.version_spec == other.version_spec
+            and self.extras == other.extras and self.marker == other.marker
+        )
 
     def __gt__(self, other):
         self._can_compare(other)
+        return self.sort_key > other.sort_key
+
+    def __lt__(self, other):
+        self._can_compare(other)
+        return self.sort_key < other.sort_key
 
-        if self.name != other.name:
-            return self.name > other.name
+    def __ge__(self, other):
+        self._can_compare(other)
+        return self.sort_key >= other.sort_key
 
-        if not all((self.version, other.version)):
-            if self.version is None and other.version is not None:
-                return True
+    def __le__(self, other):
+        self._can_compare(other)
+        return self.sort_key <= other.sort_key
+
+
+class _MarkedPackage(Package):
+    """
+    Package with extras or an environment marker, see Package.
+    """
+    __slots__ = ('extras', 'marker')
+
+
+def _default_cache_dir():
+    """
+    Directory downloaded requirements files are cached in.
+
+    # return: (str) cache directory path
+    """
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'compare_reqs')
+
+
+class _Fetcher:
+    """
+    Downloads requirements files over HTTP(S).  Connections are kept alive and
+    reused per host (one pool per thread as connections are not thread safe),
+    responses are revalidated with ETag/Last-Modified and bodies are stored in
+    a content addressed cache directory trimmed by least recent use.
+    """
+
+    def __init__(self, cache_dir=None, max_cache_size=DEFAULT_CACHE_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.cache_dir = cache_dir or _default_cache_dir()
+        self.objects_dir = os.path.join(self.cache_dir, 'objects')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.max_cache_size = max_cache_size
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        tmp_path = f'{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, f'{digest}.txt')
+
+    def _connection(self, scheme, netloc, timeout=None):
+        import http.client
+
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        key = (scheme, netloc)
+        if key not in connections:
+            connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            connections[key] = connection_class(netloc, timeout=self.timeout)
+
+        # kept-alive connections may have been opened with another timeout
+        connection = connections[key]
+        connection.timeout = self.timeout if timeout is None else timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(connection.timeout)
+        return connection
+
+    def _drop_connection(self, scheme, netloc):
+        connection = self._local.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def _request(self, url, headers, timeout=None):
+        """
+        Issue a GET over a pooled connection, retrying once if the server closed
+        the kept-alive connection in between requests.
+
+        # param timeout: (float) seconds each socket operation may take, the
+        #   fetcher's timeout if not set
+        # return: (tuple) status, response headers, body
+        """
+        import http.client
+        import urllib.request
+
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme in urllib.request.getproxies() and not urllib.request.proxy_bypass(parts.netloc):
+            # pooled connections go straight to the host, urllib knows how to
+            # talk to the proxies configured through HTTP(S)_PROXY and NO_PROXY
+            return self._request_proxied(url, headers, timeout=timeout)
+
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        for attempt in range(2):
+            connection = self._connection(parts.scheme, parts.netloc, timeout=timeout)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt:
+                    raise
+                continue
+            except OSError:
+                # a timed out connection is left mid response and cannot be reused
+                self._drop_connection(parts.scheme, parts.netloc)
+                raise
+
+            if response.will_close:
+                self._drop_connection(parts.scheme, parts.netloc)
+            return response.status, response.headers, body
+
+    def _request_proxied(self, url, headers, timeout=None):
+        """
+        Issue a GET through the configured proxy with urllib, without
+        connection reuse.
+
+        # return: (tuple) status, response headers, body
+        """
+        import urllib.error
+        import urllib.request
+
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout if timeout is None else timeout) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as error:
+            # not modified and error responses are handled by fetch
+            with error:
+                return error.code, error.headers, error.read()
+
+    def fetch(self, url, timeout=None):
+        """
+        Return a local path holding the contents of url, downloading it only when
+        the cached copy is missing or stale.
+
+        # param url: (str) http or https URL
+        # param timeout: (float) seconds each socket operation may take, the
+        #   fetcher's timeout if not set
+        # return: (str) path to the cached file
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            with self._lock:
+                entry = self._index.get(url)
+
+            headers = {}
+            if entry and os.path.exists(self._object_path(entry['digest'])):
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+            status, response_headers, body = self._request(url, headers, timeout=timeout)
+
+            if status in (301, 302, 303, 307, 308) and response_headers.get('Location'):
+                url = urllib.parse.urljoin(url, response_headers['Location'])
+                continue
+
+            if status == 304 and headers:
+                object_path = self._object_path(entry['digest'])
+                try:
+                    # touching the object marks it as recently used for eviction
+                    os.utime(object_path)
+                except FileNotFoundError:
+                    # evicted since the request was made, without the cached
+                    # copy the next request asks for the whole file
+                    continue
+                return object_path
+
+            if status != 200:
+                raise ValueError(f"Unable to fetch {url}: HTTP {status}")
+
+            return self._store(url, body, response_headers)
+
+        raise ValueError(f"Too many redirects fetching {url}")
+
+    def _store(self, url, body, response_headers):
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            tmp_path = f'{object_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, object_path)
         else:
-            self_version_parsed = version.parse(self.version)
-            other_version_parsed = version.parse(other.version)
-            if self_version_parsed != other_version_parsed:
-                return self_version_parsed > other_version_parsed
+            os.utime(object_path)
 
-            if self.version_spec != other.version_spec:
-                return self.version_spec > other.version_spec
+        with self._lock:
+            self._index[url] = {
+                'digest': digest,
+                'etag': response_headers.get('ETag'),
+                'last_modified': response_headers.get('Last-Modified'),
+            }
+            self._evict(keep=object_path)
+            self._save_index()
+        return object_path
 
-        return False
+    def _evict(self, keep):
+        """
+        Remove least recently used cached files until the cache fits its size
+        budget.  The file just stored is never evicted.
+        """
+        entries = [entry for entry in os.scandir(self.objects_dir) if entry.name.endswith('.txt')]
+        total = sum(entry.stat().st_size for entry in entries)
+        if total <= self.max_cache_size:
+            return
 
-    def __lt__(self, other):
-        return not self >= other
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_cache_size:
+                break
+            if entry.path == keep:
+                continue
+            total -= entry.stat().st_size
+            os.remove(entry.path)
 
-    def __ge__(self, other):
-        return self > other or self == other
+        remaining = {entry.name for entry in os.scandir(self.objects_dir)}
+        self._index = {
+            url: entry for url, entry in self._index.items() if f'{entry["digest"]}.txt' in remaining
+        }
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
 
-    def __le__(self, other):
-        return self < other or self == other
+
+def _get_fetcher():
+    """
+    Shared fetcher so connections and the cache index are reused across calls.
+
+    # return: (_Fetcher) default fetcher
+    """
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = _Fetcher()
+        return _default_fetcher
 
 
-def _establish_filepath(directory_path):
+def _is_url(path):
+    return path.startswith("http")
+
+
+def _requirements_location(directory_path):
     """
-    Get file path from local file system or create local file from URL.
+    Requirements file path or URL for a directory, file path or URL.
 
     # param directory_path: (str) path to directory containing requirements.txt
-    # return: (str) directory_path
+    # return: (str) requirements file path or URL
     """
     if REQUIREMENTS not in directory_path.lower():
-        file_path = os.path.join(directory_path, REQUIREMENTS_TXT)
-    else:
-        file_path = directory_path
+        return os.path.join(directory_path, REQUIREMENTS_TXT)
+    return directory_path
 
-    if file_path.startswith("http"):
-        filename = os.path.basename(file_path)
-        urllib.request.urlretrieve(file_path, filename)
-        file_path = filename
+
+def _establish_filepath(directory_path, fetcher=None, timeout=None):
+    """
+    Get file path from local file system or the download cache for URLs.
+
+    # param directory_path: (str) path to directory containing requirements.txt
+    # param fetcher: (_Fetcher) fetcher used for URLs, shared default if not set
+    # param timeout: (float) seconds each socket operation of a download may take,
+    #   the fetcher's timeout if not set
+    # return: (str) directory_path
+    """
+    file_path = _requirements_location(directory_path)
+
+    if _is_url(file_path):
+        file_path = (fetcher or _get_fetcher()).fetch(file_path, timeout=timeout)
 
     # currently only supporting local files and web URLs
     elif not os.path.exists(file_path):
@@ -107,181 +564,2565 @@ def _establish_filepath(directory_path):
         raise ValueError("requirements.txt not found in directory")
 
 
-def parse_requirements(filepath):
+# equal packages parsed from different files share a single instance, which
+# saves memory and lets dict and set lookups short circuit on identity
+_package = functools.lru_cache(maxsize=2 ** 16)(Package)
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def _parse_pep508(requirement_str):
+    """
+    Parse a requirement as described in PEP 508.  Cached on the raw string as
+    identical lines repeat heavily across files.
+
+    # param requirement_str: (str) requirement line, may carry an inline comment
+    # return: (Package) package or None if it is not a valid requirement
+    """
+    from packaging.requirements import InvalidRequirement, Requirement
+
+    try:
+        requirement = Requirement(_TRAILING_OPTIONS_RE.sub('', requirement_str))
+    except InvalidRequirement:
+        return None
+
+    specifiers = list(requirement.specifier)
+    if requirement.url:
+        # direct references are pinned to their URL
+        version_spec, version = '@', requirement.url
+    elif len(specifiers) == 1:
+        version_spec, version = specifiers[0].operator, specifiers[0].version
+    else:
+        # normalized so clause order and spacing do not matter
+        version_spec, version = str(requirement.specifier) or None, None
+    extras = sorted({canonical_name(extra) for extra in requirement.extras})
+    marker = str(requirement.marker) if requirement.marker is not None else None
+    return _package(requirement.name, version, version_spec, tuple(extras), marker)
+
+
+# lines starting with a package name, matched on raw bytes before decoding.
+# Anchoring on the newline rather than ^ lets the regex engine skip ahead to
+# candidate positions, so the buffer is searched from the newline ending the
+# previous line.
+_PACKAGE_LINE_RE = re.compile(rb'\n([A-Za-z][^\n]*)')
+_PACKAGE_START_BYTES = frozenset(string.ascii_letters.encode())
+_INCLUDE_LINE_RE = re.compile(rb'(?:^|\n)[ \t]*' + _INCLUDE_PATTERN.encode())
+
+
+@contextmanager
+def _mapped(filepath):
+    """
+    Memory map a file read only.
+
+    # param filepath: (str) path to file
+    # return: (mmap) mapped file, None for empty files which cannot be mapped
+    """
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield None
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def _release(buffer, start, end):
+    """
+    Tell the kernel pages of an already scanned window are no longer needed,
+    where the platform supports it.
+    """
+    if not hasattr(mmap, 'MADV_DONTNEED'):
+        return
+    start -= start % mmap.PAGESIZE
+    if end > start:
+        buffer.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def _iter_mapped_lines(filepath, counts=None, includes=None):
+    """
+    Scan line boundaries over a memory mapped file, decoding only lines that
+    start with a package name.  Comments, options and blank lines are skipped
+    without being decoded.
+
+    # param filepath: (str) path to requirements file
+    # param counts: (dict) number of lines scanned is added to it when given
+    # param includes: (list) (kind, target) of -r and -c options are appended when given
+    # return: (generator) candidate package lines, undecoded lines skipped
+    """
+    with _mapped(filepath) as buffer:
+        if buffer is None:
+            # empty files cannot be mapped, they are still scanned
+            if counts is not None:
+                counts['lines'] = counts.get('lines', 0)
+            return
+
+        size = len(buffer)
+        if buffer[0] in _PACKAGE_START_BYTES:
+            first_end = buffer.find(b'\n')
+            yield buffer[:first_end if first_end != -1 else size].decode()
+
+        start = lines = 0
+        while start < size:
+            # windows end on a newline which the next window starts from, so
+            # no line is split between them
+            end = buffer.find(b'\n', min(start + MMAP_WINDOW, size - 1) + 1)
+            end = size if end == -1 else end
+            for matched in _PACKAGE_LINE_RE.finditer(buffer, start, end):
+                yield matched.group(1).decode()
+            if includes is not None:
+                for matched in _INCLUDE_LINE_RE.finditer(buffer, start, end):
+                    option, target = matched.groups()
+                    includes.append((_INCLUDE_KINDS[option.decode()], target.decode()))
+
+            if counts is not None:
+                lines += buffer[start:end].count(b'\n')
+            _release(buffer, start, end)
+            start = end
+
+        if counts is not None:
+            # a final line without a trailing newline still counts
+            counts['lines'] = counts.get('lines', 0) + lines + (buffer[size - 1] != ord('\n'))
+
+
+def _file_digest(filepath):
+    """
+    Content hash of a file, hashed window by window over a memory mapping.
+
+    # param filepath: (str) path to file
+    # return: (str) sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    with _mapped(filepath) as buffer:
+        if buffer is not None:
+            view = memoryview(buffer)
+            try:
+                for start in range(0, len(buffer), MMAP_WINDOW):
+                    end = min(start + MMAP_WINDOW, len(buffer))
+                    digest.update(view[start:end])
+                    _release(buffer, start, end)
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def _iter_text_lines(filepath, counts=None, includes=None):
+    lines = 0
+    with open(filepath, 'r') as f:
+        for lines, line in enumerate(f, 1):
+            first = line[:1]
+            if first.isalpha():
+                yield line
+            elif includes is not None and first in '- \t':
+                matched = _INCLUDE_RE.match(line.strip())
+                if matched is not None:
+                    option, target = matched.groups()
+                    includes.append((_INCLUDE_KINDS[option], target))
+
+    if counts is not None:
+        counts['lines'] = counts.get('lines', 0) + lines
+
+
+def iter_requirements(filepath, use_mmap=False, counts=None, includes=None, pep508=False):
+    """
+    Lazily parse requirements.txt file line by line, yielding packages as they
+    are found so arbitrarily large files are parsed in bounded memory.  Performs
+    only basic parsing unless PEP 508 parsing is requested and skips any line
+    not starting with a package name.
+
+    # param filepath: (str) path to requirements.txt file
+    # param use_mmap: (bool) scan a memory mapping of the file, decoding only package
+    #   lines, suited to very large frozen requirements files
+    # param counts: (dict) number of lines scanned is added to it when given
+    # param includes: (list) (kind, target) of -r and -c options are appended when
+    #   given, kind being REQUIREMENT_INCLUDE or CONSTRAINT_INCLUDE
+    # param pep508: (bool) parse extras, markers and multi clause specifiers with
+    #   packaging, lines it rejects are kept whole as the package name
+    # return: (generator) packages in file order, duplicates included
+    """
+    read_lines = _iter_mapped_lines if use_mmap else _iter_text_lines
+    yield from _iter_line_packages(read_lines(filepath, counts=counts, includes=includes), pep508=pep508)
+
+
+def _iter_line_packages(lines, pep508=False):
+    if pep508:
+        for line in lines:
+            package_str = line.strip()
+            package = _parse_pep508(package_str)
+            yield package if package is not None else _package(package_str)
+        return
+
+    match = _REQUIREMENT_RE.match
+    for line in lines:
+        package_str = line.strip()
+        matched = match(package_str)
+        if matched is None:
+            # not something we can split, keep the line as the name
+            yield _package(package_str)
+            continue
+
+        name, version_spec, version_str = matched.groups()
+        if version_spec and version_str:
+            yield _package(name, version_str, version_spec)
+        else:
+            yield _package(name)
+
+
+def parse_requirements(filepath, use_mmap=False, counts=None, includes=None, pep508=False):
     """
     Parse requirements.txt file and return list of packages.  Performs only
     basic parsing of requirements.txt file.  Does not support all features
-    and formats.
+    and formats.  Included files are not followed, see resolve_requirements.
 
     # param filepath: (str) path to requirements.txt file
+    # param use_mmap: (bool) read through a memory mapping of the file
+    # param counts: (dict) number of lines scanned is added to it when given
+    # param includes: (list) (kind, target) of -r and -c options are appended when given
+    # param pep508: (bool) parse requirements fully as described in PEP 508
     # return: (tuple) tuple of packages
     """
-    with open(filepath, 'r') as f:
-        data = []
-        for line in f.readlines():
-            if line != '\n' and line[0].isalpha():
-                data.append(line.strip())
-
-    packages = set([])
-
-    for package_str in data:
-        deliminated = False
-
-        for idx, char in enumerate(package_str):
-            # only care about specifier characters to split on
-            if char in SPECIFIERS:
-                deliminated = True
-                # in the case there is additional '=' in the specifier
-                # no long a 'char' but just semantics at this point
-                if package_str[idx + 1] in SPECIFIERS:
-                    char = char + package_str[idx + 1]
-
-                module = package_str.split(char)
-                module_data = {'name': module[0]}
-                if len(module) > 1:
-                    module_data.update({
-                        'version_spec': char,
-                        'version': module[1],
-                    })
-
-                packages.add(Package(**module_data))
-                break
+    # dict keeps the first occurrence of each package in file order
+    return tuple(dict.fromkeys(
+        iter_requirements(filepath, use_mmap=use_mmap, counts=counts, includes=includes, pep508=pep508)
+    ))
 
-        # Check for modules w/o a specifier.
-        if not deliminated:
-            packages.add(Package(name=package_str))
 
-    return tuple(packages)
+def _parse_file(filepath, use_mmap=False, counts=None, pep508=False):
+    """
+    Parse a single requirements file keeping the files it includes.
+
+    # return: (tuple) tuple of packages, tuple of (kind, target) includes
+    """
+    includes = []
+    packages = parse_requirements(filepath, use_mmap=use_mmap, counts=counts, includes=includes, pep508=pep508)
+    return packages, tuple(includes)
 
 
-def _compare_reqs(*directories):
+def _apply_constraints(packages, constraints):
     """
-    Compare requirements.txt files in directories.  More than 1 required for comparison.
-    Setup as internal function to allow for easier testing.
+    Pin packages required without a version to the version a constraints file
+    gives them.  Constraints on packages that are not required are dropped and
+    versions already given by a requirement are kept as written.
 
-    # param directories: (list) list of directories to compare
-    # return: (tuple) tuple of package results
+    # param packages: (iterable) required packages
+    # param constraints: (dict) canonical package name -> constraining package
+    # return: (tuple) tuple of packages
     """
-    if not directories:
-        raise ValueError("No directories provided")
-    elif len(directories) == 1:
-        raise ValueError("Only one directory provided")
+    constrained = []
+    for package in packages:
+        constraint = constraints.get(package.canonical_name)
+        if package.version is None and constraint is not None and constraint.version is not None:
+            package = _package(
+                package.name, constraint.version, constraint.version_spec, package.extras, package.marker
+            )
+        constrained.append(package)
+    return tuple(dict.fromkeys(constrained))
 
-    filepaths = [_establish_filepath(directory) for directory in directories]
-    packages = {filepath: parse_requirements(filepath) for filepath in filepaths}
 
-    # we want to track packages unique to each directory, differing by versions
-    # in at least one directory, and packages that are the same across all
-    unique_packages = defaultdict(list)
-    diff_packages = defaultdict(list)
-    same_packages = defaultdict(list)
+class _RequirementsGraph:
+    """
+    Requirements files reachable through -r and -c includes, shared by every
+    source of a comparison.  Includes form a DAG: each file is parsed once
+    however many files include it and its resolved packages are reused by
+    every includer, while a file including itself raises ValueError.
+
+    Packages of a required file are added after the packages of its includer.
+    Constraints apply to the whole resolved source as with pip, wherever they
+    were included, and only pin required packages given without a version.
+    Relative targets are resolved against the including file, or its URL for
+    downloaded files.
+    """
+
+    def __init__(self, parse=_parse_file, snapshot=None):
+        self._parse = parse
+        self._snapshot = snapshot
+        self._lock = threading.Lock()
+        self._parsing = {}      # filepath -> lock held while the file is parsed
+        self._parsed = {}       # filepath -> (packages, includes)
+        self._resolved = {}     # absolute path or URL -> (required packages, constraints)
+
+    def add(self, filepath, parsed):
+        """
+        Use a parse result obtained elsewhere, e.g. in a worker process.
+        """
+        with self._lock:
+            self._parsed[os.path.abspath(filepath)] = parsed
+
+    def parsed(self, filepath, counts=None):
+        """
+        Parse a file unless it already was during this run.
 
+        # param filepath: (str) path to requirements file
+        # param counts: (dict) number of lines scanned is added to it when parsed
+        # return: (tuple) tuple of packages, tuple of (kind, target) includes
+        """
+        with self._lock:
+            parsed = self._parsed.get(filepath)
+            if parsed is not None:
+                return parsed
+            file_lock = self._parsing.setdefault(filepath, threading.Lock())
+
+        # only the first of several sources sharing an include parses it
+        with file_lock:
+            with self._lock:
+                parsed = self._parsed.get(filepath)
+            if parsed is None:
+                parse = self._parse if counts is None else functools.partial(self._parse, counts=counts)
+                parsed = self._snapshot.parse(filepath, parse=parse) if self._snapshot is not None else parse(filepath)
+                with self._lock:
+                    self._parsed[filepath] = parsed
+        return parsed
+
+    def resolve(self, filepath, url=None, counts=None):
+        """
+        Packages of a requirements file with everything it includes applied.
+
+        # param filepath: (str) path to requirements file
+        # param url: (str) URL the file was downloaded from, if any
+        # param counts: (dict) number of lines scanned is added to it
+        # return: (tuple) tuple of packages
+        """
+        required, constraints = self._resolve(filepath, url, counts, ())
+        return _apply_constraints(required, constraints) if constraints else required
+
+    def _resolve(self, filepath, url, counts, chain):
+        filepath = os.path.abspath(filepath)
+        key = url or filepath
+        if key in chain:
+            cycle = ' -> '.join(chain[chain.index(key):] + (key,))
+            raise ValueError(f"Requirements include cycle: {cycle}")
+
+        with self._lock:
+            resolved = self._resolved.get(key)
+        if resolved is not None:
+            return resolved
+
+        packages, includes = self.parsed(filepath, counts=counts)
+        constraints = {}
+        if includes:
+            required = list(packages)
+            for kind, target in includes:
+                included, included_constraints = self._resolve(
+                    *self._locate(filepath, url, target), counts, chain + (key,)
+                )
+                if kind == REQUIREMENT_INCLUDE:
+                    required.extend(included)
+                else:
+                    # everything a constraints file lists only constrains
+                    for package in included:
+                        constraints.setdefault(package.canonical_name, package)
+                for name, package in included_constraints.items():
+                    constraints.setdefault(name, package)
+            packages = tuple(dict.fromkeys(required))
+
+        resolved = packages, constraints
+        with self._lock:
+            self._resolved[key] = resolved
+        return resolved
+
+    @staticmethod
+    def _locate(filepath, url, target):
+        """
+        Local path and URL, if any, of a file included from another.
+        """
+        if url or _is_url(target):
+            target_url = urllib.parse.urljoin(url or '', target)
+            return _get_fetcher().fetch(target_url), target_url
+
+        target_path = os.path.join(os.path.dirname(filepath), os.path.expanduser(target))
+        if not os.path.isfile(target_path):
+            raise ValueError(f"Included requirements file not found: {target} (included from {filepath})")
+        return target_path, None
+
+
+def resolve_requirements(filepath, use_mmap=False, pep508=False):
+    """
+    Parse requirements.txt file following its -r and -c includes.  Required
+    files add their packages after the including file's, constraints files pin
+    packages the including files require without a version.
+
+    # param filepath: (str) path to requirements.txt file
+    # param use_mmap: (bool) read through memory mappings of the files
+    # param pep508: (bool) parse requirements fully as described in PEP 508
+    # return: (tuple) tuple of packages
+    """
+    return _RequirementsGraph(functools.partial(_parse_file, use_mmap=use_mmap, pep508=pep508)).resolve(filepath)
+
+
+# categories assigned to each (package, filepath) pair by the comparison engine
+DIFF = 'diff'
+UNIQUE = 'unique'
+SAME = 'same'
+
+
+def _index_packages(packages):
+    """
+    Index parsed packages by canonical name so each package is only ever
+    compared against the packages sharing its name instead of every package in
+    every file, whichever way each file spells the name.
+
+    # param packages: (dict) filepath -> iterable of packages
+    # return: (dict) canonical package name -> {filepath: [packages]}
+    """
+    index = {}
     for filepath, package_set in packages.items():
         for package in package_set:
-            found, is_same_package = False, False
+            index.setdefault(package.canonical_name, {}).setdefault(filepath, []).append(package)
+    return index
 
-            for filepath2, package_set2 in packages.items():
-                if filepath == filepath2:
-                    continue
 
-                # compare package to all packages in this directory by searching for
-                # exact match or different version, if exact match continue keep
-                # searching for different version but if different version then stop
-                # and add to diff_packages, if neither easily can assume unique
-                for package2 in package_set2:
-                    if package == package2:
-                        found = True
-                        is_same_package = True
-                    elif package.name == package2.name:
-                        found = True
-                        is_same_package = False
-                        diff_packages[package].append(filepath)
-                        break
-
-                # if we found a match but it was a different version
-                # then no reason to keep looking
-                if found and not is_same_package:
-                    break
-
-            if found and is_same_package:
-                same_packages[package].append(filepath)
-            elif not found:
-                unique_packages[package].append(filepath)
-
-    return diff_packages, unique_packages, same_packages
+def _classify_entries(entries):
+    """
+    Classify all packages sharing a single canonical name.  A package is unique
+    when no other file lists the name, different when another file lists the
+    name with a different version and the same otherwise.  Spelling of the name
+    does not matter.
+
+    # param entries: (dict) filepath -> list of packages with the same name
+    # return: (generator) (category, package, filepath) tuples in file order
+    """
+    if len(entries) == 1:
+        for filepath, package_list in entries.items():
+            for package in package_list:
+                yield UNIQUE, package, filepath
+        return
 
+    # distinct pins are almost always a handful, so working out which files
+    # hold a different pin per distinct pin is cheap
+    holders = {}
+    for filepath, package_list in entries.items():
+        for package in package_list:
+            holders.setdefault(package.pin, set()).add(filepath)
 
-def _print_table(diff_packages, unique_packages, same_packages, show_diff_versions,
-                 show_unique, show_same, remove_spaces):
+    if len(holders) == 1:
+        for filepath, package_list in entries.items():
+            for package in package_list:
+                yield SAME, package, filepath
+        return
+
+    holding_other = {
+        pin: set().union(*(files for other, files in holders.items() if other is not pin))
+        for pin in holders
+    }
+    for filepath, package_list in entries.items():
+        for package in package_list:
+            files = holding_other[package.pin]
+            is_diff = len(files) > 1 or (files and filepath not in files)
+            yield (DIFF if is_diff else SAME), package, filepath
+
+
+def _iter_classified(packages):
     """
-    Prints table of packages comparison results.
+    Classify every package across the parsed requirements files in a single pass
+    over a name index.
 
-    :param diff_packages: (dict) packages with different versions
-    :param unique_packages: (dict) packages unique to directory
-    :param same_packages: (dict) packages with same versions
-    :param show_diff_versions: (bool) show packages with different versions
-    :param show_unique: (bool) show packages unique to directory
-    :param show_same: (bool) show packages with same versions
-    :param remove_spaces: (bool) remove spaces from package versions
+    # param packages: (dict) filepath -> iterable of packages, in input order
+    # return: (generator) (category, package, filepath) tuples
     """
-    tprint("Package  Comparison", font="small")
-    print(f"Show Diff Package Versions:   {show_diff_versions}")
-    print(f"Show Unique Packages:         {show_unique}")
-    print(f"Show Shared Packages:         {show_same}")
-    print()
+    for entries in _index_packages(packages).values():
+        yield from _classify_entries(entries)
 
-    if show_diff_versions:
-        print("Packages with different versions across directories:")
-        sorted_packages = sorted(diff_packages.items(), key=lambda x: (x[0].name, x[0].version))
-        for package, filepaths in sorted_packages:
-            for filepath in filepaths:
-                package_str = str(package)
-                if remove_spaces:
-                    package_str = str(package).replace(" ", "")
-                print(f'{package_str.ljust(30)} - {filepath}')
-        print()
 
-    if show_unique:
-        print("Packages only found in a specific directory:")
-        sorted_packages = sorted(unique_packages.items(), key=lambda x: x[0].name)
-        for package, filepaths in sorted_packages:
-            package_str = str(package)
-            if remove_spaces:
-                package_str = package_str.replace(" ", "")
-            print(f'{package_str.ljust(30)} - {filepaths[0]}')
-        print()
+def _classify_packages(packages):
+    """
+    Build the diff, unique and same package results from parsed requirements.
 
-    if show_same:
-        print("Packages with same versions across directories:")
-        sorted_packages = sorted(same_packages.items(), key=lambda x: x[0].name)
-        for package, filepaths in sorted_packages:
-            package_str = str(package)
-            if remove_spaces:
-                package_str = package_str.replace(" ", "")
-            print(f'{package_str}')
-        print()
+    # param packages: (dict) filepath -> iterable of packages, in input order
+    # return: (tuple) diff_packages, unique_packages, same_packages
+    """
+    # we want to track packages unique to each directory, differing by versions
+    # in at least one directory, and packages that are the same across all
+    results = {DIFF: defaultdict(list), UNIQUE: defaultdict(list), SAME: defaultdict(list)}
+    for category, package, filepath in _iter_classified(packages):
+        results[category][package].append(filepath)
+
+    return results[DIFF], results[UNIQUE], results[SAME]
 
 
-def compare_reqs(*directories, show_diff_versions=True, show_same=False, show_unique=False, remove_spaces=False):
+class CompactResult:
     """
-    Prints table of packages comparison results.
+    Comparison results stored column wise for large comparisons.  Strings are
+    kept once in an intern table, packages as parallel arrays of string ids
+    and (category, package, source) records as parallel arrays of package ids,
+    source ids and status codes.  Arrays use the narrowest item size their ids
+    fit, widening as tables grow, so results pickle as a few flat buffers.
 
-    # param directories: (list) list of directories to compare
-    # param show_diff_versions: (bool) show packages with different versions
-    # param show_same: (bool) show packages with same versions
-    # param show_unique: (bool) show packages unique to directory
-    # param remove_spaces: (bool) remove spaces from package versions
+    Iterating gives diff_packages, unique_packages and same_packages rebuilt
+    in the usual dict shape, so results unpack like those of _compare_reqs.
     """
-    try:
-        diff_packages, unique_packages, same_packages = _compare_reqs(*directories)
+    CATEGORIES = (DIFF, UNIQUE, SAME)
+    PACKAGE_COLUMNS = ('names', 'versions', 'version_specs', 'extras', 'markers')
+    RECORD_COLUMNS = ('record_packages', 'record_sources', 'statuses')
 
-        # split internal and public methods to allow for testing and utilize this method to print
-        _print_table(diff_packages, unique_packages, same_packages, show_diff_versions,
-                     show_unique, show_same, remove_spaces)
-    except ValueError as e:
+    def __init__(self):
+        self.strings = [None]       # string id -> string, id 0 is None
+        self.sources = []           # source id -> source label
+        self.names = array('B')     # package id -> string id, as are the four below
+        self.versions = array('B')
+        self.version_specs = array('B')
+        self.extras = array('B')    # comma joined
+        self.markers = array('B')
+        self.record_packages = array('B')
+        self.record_sources = array('B')
+        self.statuses = array('B')  # index into CATEGORIES
+        self._lookups = None
+        self._packages = None
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        # param records: (iterable) (category, package, source) records
+        # return: (CompactResult) results holding the records in order
+        """
+        result = cls()
+        for category, package, source in records:
+            result.add(category, package, source)
+        # the lookups are only needed while adding and cost more than the columns
+        result._lookups = None
+        return result
+
+    @classmethod
+    def from_results(cls, diff_packages, unique_packages, same_packages):
+        return cls.from_records(_iter_results(diff_packages, unique_packages, same_packages))
+
+    def _append(self, column, value):
+        values = getattr(self, column)
+        try:
+            values.append(value)
+        except OverflowError:
+            values = array('H' if values.typecode == 'B' else 'I', values)
+            values.append(value)
+            setattr(self, column, values)
+
+    def _string_id(self, value):
+        string_ids = self._lookups[0]
+        idx = string_ids.get(value)
+        if idx is None:
+            idx = string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return idx
+
+    def add(self, category, package, source):
+        """
+        Append a single record.
+        """
+        if self._lookups is None:
+            self._lookups = (
+                {value: idx for idx, value in enumerate(self.strings)},
+                {value: idx for idx, value in enumerate(self.sources)},
+                {package: idx for idx, package in enumerate(self._iter_packages())},
+            )
+        _, source_ids, package_ids = self._lookups
+
+        package_id = package_ids.get(package)
+        if package_id is None:
+            package_id = package_ids[package] = len(self.names)
+            values = (package.name, package.version, package.version_spec, ','.join(package.extras) or None,
+                      package.marker)
+            for column, value in zip(self.PACKAGE_COLUMNS, values):
+                self._append(column, self._string_id(value))
+            if self._packages is not None:
+                self._packages.append(package)
+
+        source_id = source_ids.get(source)
+        if source_id is None:
+            source_id = source_ids[source] = len(self.sources)
+            self.sources.append(source)
+
+        self._append('record_packages', package_id)
+        self._append('record_sources', source_id)
+        self.statuses.append(self.CATEGORIES.index(category))
+
+    def _iter_packages(self):
+        strings = self.strings
+        columns = (getattr(self, column) for column in self.PACKAGE_COLUMNS)
+        for name, version, version_spec, extras, marker in zip(*columns):
+            extras = strings[extras]
+            yield _package(strings[name], strings[version], strings[version_spec],
+                           tuple(extras.split(',')) if extras else (), strings[marker])
+
+    def packages(self):
+        """
+        Package for every package id, built on first use.
+        """
+        if self._packages is None:
+            self._packages = list(self._iter_packages())
+        return self._packages
+
+    def records(self):
+        """
+        # return: (generator) (category, package, source) records in order
+        """
+        packages, sources, categories = self.packages(), self.sources, self.CATEGORIES
+        for package_id, source_id, status in zip(self.record_packages, self.record_sources, self.statuses):
+            yield categories[status], packages[package_id], sources[source_id]
+
+    def results(self):
+        """
+        Rebuild diff_packages, unique_packages and same_packages dicts of
+        package -> [sources] in a single pass over the records.
+        """
+        packages, sources = self.packages(), self.sources
+        results = tuple(defaultdict(list) for _ in self.CATEGORIES)
+        for package_id, source_id, status in zip(self.record_packages, self.record_sources, self.statuses):
+            results[status][packages[package_id]].append(sources[source_id])
+        return results
+
+    def view(self, category):
+        """
+        Rebuild the package -> [sources] dict of one category.
+        """
+        wanted = self.CATEGORIES.index(category)
+        packages, sources = self.packages(), self.sources
+        view = defaultdict(list)
+        for package_id, source_id, status in zip(self.record_packages, self.record_sources, self.statuses):
+            if status == wanted:
+                view[packages[package_id]].append(sources[source_id])
+        return view
+
+    @property
+    def diff_packages(self):
+        return self.view(DIFF)
+
+    @property
+    def unique_packages(self):
+        return self.view(UNIQUE)
+
+    @property
+    def same_packages(self):
+        return self.view(SAME)
+
+    def __iter__(self):
+        return iter(self.results())
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def __getstate__(self):
+        # lookups and built packages are rebuilt on demand rather than pickled
+        names = ('strings', 'sources') + self.PACKAGE_COLUMNS + self.RECORD_COLUMNS
+        return {name: getattr(self, name) for name in names}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lookups = None
+        self._packages = None
+
+
+# versions allowed by a specifier as a tuple of disjoint (low, low_inclusive,
+# high, high_inclusive) intervals over parsed versions, None for an unbounded
+# side.  Pre-release and local version rules of PEP 440 are not modelled.
+_ANY_VERSION = ((None, False, None, False),)
+
+
+def _next_prefix(version, length):
+    """
+    Smallest version after every version starting with the first length
+    release segments of version, e.g. 1.3.dev0 for 1.2.* or ~=1.2.0.
+    """
+    from packaging.version import Version
+
+    release = list(version.release[:length])
+    release[-1] += 1
+    return Version(f'{version.epoch}!{".".join(map(str, release))}.dev0')
+
+
+def _clause_intervals(operator, version_str):
+    """
+    Versions allowed by a single specifier clause.
+
+    # param operator: (str) comparison operator, e.g. '>='
+    # param version_str: (str) version, may end with .* for == and !=
+    # return: (tuple) intervals, None when the clause cannot be analyzed
+    """
+    from packaging.version import InvalidVersion, Version
+
+    wildcard = version_str.endswith('.*')
+    try:
+        version = Version(version_str[:-2] if wildcard else version_str)
+    except InvalidVersion:
+        return None
+
+    if wildcard:
+        low = Version(f'{version.epoch}!{".".join(map(str, version.release))}.dev0')
+        high = _next_prefix(version, len(version.release))
+        if operator == '==':
+            return ((low, True, high, False),)
+        return ((None, False, low, False), (high, True, None, False))
+
+    if operator in ('==', '==='):
+        return ((version, True, version, True),)
+    elif operator == '!=':
+        return ((None, False, version, False), (version, False, None, False))
+    elif operator == '>=':
+        return ((version, True, None, False),)
+    elif operator == '>':
+        return ((version, False, None, False),)
+    elif operator == '<=':
+        return ((None, False, version, True),)
+    elif operator == '<':
+        return ((None, False, version, False),)
+    elif operator == '~=' and len(version.release) > 1:
+        return ((version, True, _next_prefix(version, len(version.release) - 1), False),)
+    return None
+
+
+def _intersect_interval(left, right):
+    left_low, left_low_inclusive, left_high, left_high_inclusive = left
+    right_low, right_low_inclusive, right_high, right_high_inclusive = right
+
+    if left_low is None or (right_low is not None and right_low > left_low):
+        low, low_inclusive = right_low, right_low_inclusive
+    elif right_low is None or left_low > right_low:
+        low, low_inclusive = left_low, left_low_inclusive
+    else:
+        low, low_inclusive = left_low, left_low_inclusive and right_low_inclusive
+
+    if left_high is None or (right_high is not None and right_high < left_high):
+        high, high_inclusive = right_high, right_high_inclusive
+    elif right_high is None or left_high < right_high:
+        high, high_inclusive = left_high, left_high_inclusive
+    else:
+        high, high_inclusive = left_high, left_high_inclusive and right_high_inclusive
+
+    if low is not None and high is not None and (
+            low > high or (low == high and not (low_inclusive and high_inclusive))):
+        return None
+    return low, low_inclusive, high, high_inclusive
+
+
+def _intersect_intervals(left, right):
+    """
+    Versions allowed by both of two interval tuples.
+    """
+    intersection = []
+    for left_interval in left:
+        for right_interval in right:
+            interval = _intersect_interval(left_interval, right_interval)
+            if interval is not None:
+                intersection.append(interval)
+    return tuple(intersection)
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def _specifier_intervals(specifier):
+    """
+    Versions allowed by every clause of a specifier, computed once per
+    distinct specifier string however many files use it.
+
+    # param specifier: (str) comma separated version specifiers
+    # return: (tuple) intervals, empty if no version is allowed
+    """
+    specifier_set = _specifier_set(specifier)
+    if specifier_set is None:
+        return _ANY_VERSION
+
+    intervals = _ANY_VERSION
+    for clause in specifier_set:
+        clause_intervals = _clause_intervals(clause.operator, clause.version)
+        # clauses that cannot be analyzed, e.g. arbitrary strings, constrain nothing
+        if clause_intervals is not None:
+            intervals = _intersect_intervals(intervals, clause_intervals)
+    return intervals
+
+
+def _is_satisfiable(specifiers):
+    """
+    Whether some version is allowed by every one of the specifiers.
+
+    # param specifiers: (iterable) specifier strings
+    # return: (bool) False if the specifiers have no version in common
+    """
+    intervals = _ANY_VERSION
+    for specifier in specifiers:
+        intervals = _intersect_intervals(intervals, _specifier_intervals(specifier))
+        if not intervals:
+            return False
+    return True
+
+
+def _find_conflicts(packages):
+    """
+    Find package names whose specifiers across all files, and within a file,
+    cannot be satisfied together.  Work is batched per canonical name and
+    distinct specifier, so thousands of files pinning the same handful of
+    ranges cost a handful of intersections.  Packages with an environment
+    marker are only checked against packages without one and packages with
+    the same marker.
+
+    # param packages: (dict) filepath -> iterable of packages, in input order
+    # return: (dict) canonical package name -> {filepath: [packages]} for conflicting names
+    """
+    conflicts = {}
+    for name, entries in _index_packages(packages).items():
+        by_marker = {}
+        for package_list in entries.values():
+            for package in package_list:
+                # direct URL references name no version range
+                if package.version_spec and package.version_spec != '@':
+                    by_marker.setdefault(package.marker, set()).add(package.version_spec + (package.version or ''))
+        if not by_marker:
+            continue
+
+        unconditional = by_marker.pop(None, set())
+        groups = [unconditional | specifiers for specifiers in by_marker.values()] or [unconditional]
+        if not all(_is_satisfiable(specifiers) for specifiers in groups):
+            conflicts[name] = entries
+    return conflicts
+
+
+# int.bit_count is only available from Python 3.10
+_popcount = getattr(int, 'bit_count', None) or (lambda value: bin(value).count('1'))
+
+
+def _bitset(ids):
+    """
+    Pack ids into an int with bit id set for each of them.
+    """
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for idx in ids:
+        buffer[idx >> 3] |= 1 << (idx & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _drift_matrix(packages, jaccard=False):
+    """
+    Count how far apart every pair of files is in a single pass.  Each file is
+    reduced to a bitset of the package names it lists and a bitset of the
+    exact packages it lists, so each pair costs two ANDs and popcounts rather
+    than a full comparison.
+
+    For row file i and column file j, shared counts names listed by both,
+    same packages listed identically by both, different shared names not
+    listed identically and unique names listed by i but not by j.  Jaccard
+    similarity is that of the two sets of exact packages.
+
+    # param packages: (dict) filepath -> iterable of packages, in input order
+    # param jaccard: (bool) include the jaccard similarity matrix
+    # return: (dict) 'sources' and N x N 'shared', 'same', 'different', 'unique' and
+    #   optionally 'jaccard' matrices, rows and columns in input order
+    """
+    name_ids = {}
+    pin_ids = {}
+    name_bits = []
+    pin_bits = []
+    for package_set in packages.values():
+        names = set()
+        pins = set()
+        for package in package_set:
+            names.add(name_ids.setdefault(package.canonical_name, len(name_ids)))
+            pins.add(pin_ids.setdefault((package.canonical_name, package.pin), len(pin_ids)))
+        name_bits.append(_bitset(names))
+        pin_bits.append(_bitset(pins))
+
+    size = len(name_bits)
+    name_counts = [_popcount(bits) for bits in name_bits]
+    pin_counts = [_popcount(bits) for bits in pin_bits]
+    shared = [[0] * size for _ in range(size)]
+    same = [[0] * size for _ in range(size)]
+    different = [[0] * size for _ in range(size)]
+    unique = [[0] * size for _ in range(size)]
+    similarity = [[1.0] * size for _ in range(size)] if jaccard else None
+
+    # pairs are symmetric apart from unique, so only the upper triangle is counted
+    for i in range(size):
+        row_names, row_pins = name_bits[i], pin_bits[i]
+        for j in range(i, size):
+            shared_count = _popcount(row_names & name_bits[j])
+            same_count = _popcount(row_pins & pin_bits[j])
+            shared[i][j] = shared[j][i] = shared_count
+            same[i][j] = same[j][i] = same_count
+            different[i][j] = different[j][i] = max(shared_count - same_count, 0)
+            unique[i][j] = name_counts[i] - shared_count
+            unique[j][i] = name_counts[j] - shared_count
+            if jaccard and i != j:
+                union = pin_counts[i] + pin_counts[j] - same_count
+                similarity[i][j] = similarity[j][i] = same_count / union if union else 1.0
+
+    matrix = {'sources': list(packages), 'shared': shared, 'same': same, 'different': different, 'unique': unique}
+    if jaccard:
+        matrix['jaccard'] = similarity
+    return matrix
+
+
+class SnapshotStore:
+    """
+    Parse results and classification of the last comparison, optionally
+    persisted to disk, used to make repeated comparisons incremental.  Files
+    are only re-parsed when their mtime and size change and their content hash
+    no longer matches, and only package names found in changed files are
+    reclassified.
+    """
+    FORMAT_VERSION = 4
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._parser = None     # parser the recorded files were parsed with
+        self._files = {}        # filepath -> ((mtime_ns, size), digest, (packages, includes))
+        self._labels = {}       # source label -> packages, in the order last compared
+        self._index = {}        # canonical package name -> {source label: [packages]}
+        self._classified = {}   # canonical package name -> [(category, package, source label)]
+        self._results = None    # diff_packages, unique_packages, same_packages
+        self.changes = None     # (removed, added) records of the last classify, None after a full one
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+
+        if state.get('format_version') != self.FORMAT_VERSION:
+            return
+        self._parser = state['parser']
+        self._files = state['files']
+        self._labels = state['labels']
+        self._index = state['index']
+        self._classified = state['classified']
+        self._results = state['results']
+
+    def save(self):
+        """
+        Persist the snapshot to its path, if it has one.
+        """
+        if not self.path:
+            return
+
+        state = {
+            'format_version': self.FORMAT_VERSION,
+            'parser': self._parser,
+            'files': self._files,
+            'labels': self._labels,
+            'index': self._index,
+            'classified': self._classified,
+            'results': self._results,
+        }
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def use_parser(self, parser):
+        """
+        Forget parse results recorded with a different parser.
+
+        # param parser: (str) name of the parser files are about to be parsed with
+        """
+        with self._lock:
+            if parser != self._parser:
+                self._parser = parser
+                self._files = {}
+
+    def is_stale(self, filepath):
+        """
+        Whether the file has to be parsed again.  Files whose mtime or size
+        changed but whose content did not are refreshed without parsing.
+
+        # param filepath: (str) path to requirements file
+        # return: (bool) True if the file changed since it was last parsed
+        """
+        stat = os.stat(filepath)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._files.get(filepath)
+        if cached is None:
+            return True
+        if cached[0] == signature:
+            return False
+
+        digest = _file_digest(filepath)
+        if digest != cached[1]:
+            return True
+        with self._lock:
+            self._files[filepath] = (signature, digest, cached[2])
+        return False
+
+    def record(self, filepath, packages):
+        """
+        Remember freshly parsed packages for a file.
+
+        # param filepath: (str) path to requirements file
+        # param packages: (tuple) parsed packages and includes
+        """
+        stat = os.stat(filepath)
+        entry = ((stat.st_mtime_ns, stat.st_size), _file_digest(filepath), packages)
+        with self._lock:
+            self._files[filepath] = entry
+
+    def packages(self, filepath):
+        """
+        Packages and includes last recorded for a file.
+        """
+        with self._lock:
+            return self._files[filepath][2]
+
+    def filepaths(self):
+        """
+        Every file recorded, including files only reached through includes.
+        """
+        with self._lock:
+            return list(self._files)
+
+    def parse(self, filepath, parse=None):
+        """
+        Parse a requirements file unless an up to date snapshot of it exists.
+
+        # param filepath: (str) path to requirements file
+        # param parse: (callable) parser to use, _parse_file if not set
+        # return: (tuple) tuple of packages, tuple of (kind, target) includes
+        """
+        if self.is_stale(filepath):
+            self.record(filepath, (parse or _parse_file)(filepath))
+        return self.packages(filepath)
+
+    def classify(self, packages):
+        """
+        Classify packages, reusing the previous classification for every
+        package name whose packages did not change in any source.  Falls back
+        to a full classification when the sources themselves changed.  The
+        records that changed are left in changes.
+
+        # param packages: (dict) source label -> tuple of packages, in input order
+        # return: (tuple) diff_packages, unique_packages, same_packages
+        """
+        if self._results is None or list(packages) != list(self._labels):
+            return self._classify_all(packages)
+
+        changed = [
+            label for label, package_set in packages.items()
+            if package_set is not self._labels[label] and package_set != self._labels[label]
+        ]
+        removed, added = [], []
+        self.changes = removed, added
+        if not changed:
+            return self._results
+
+        dirty = set()
+        for label in changed:
+            # classification depends only on which packages a source holds, so
+            # names whose packages did not change keep their records
+            dirty.update(package.canonical_name for package in set(self._labels[label]) ^ set(packages[label]))
+            for package in self._labels[label]:
+                self._index[package.canonical_name].pop(label, None)
+            for package in packages[label]:
+                self._index.setdefault(package.canonical_name, {}).setdefault(label, []).append(package)
+            self._labels[label] = packages[label]
+
+        results = dict(zip((DIFF, UNIQUE, SAME), self._results))
+        order = {label: idx for idx, label in enumerate(packages)}
+        touched = set()
+        for name in dirty:
+            old_records = set(self._classified.pop(name, ()))
+            entries = self._index.get(name)
+            new_records = set()
+            if entries:
+                # keep sources in input order so results match a full comparison
+                entries = self._index[name] = dict(sorted(entries.items(), key=lambda item: order[item[0]]))
+                records = self._classified[name] = list(_classify_entries(entries))
+                new_records.update(records)
+            else:
+                self._index.pop(name, None)
+
+            # most sources keep their classification when another source changes
+            for category, package, label in old_records - new_records:
+                results[category][package].remove(label)
+                touched.add((category, package))
+                removed.append((category, package, label))
+            for category, package, label in new_records - old_records:
+                results[category][package].append(label)
+                touched.add((category, package))
+                added.append((category, package, label))
+
+        for category, package in touched:
+            labels = results[category][package]
+            if labels:
+                labels.sort(key=order.__getitem__)
+            else:
+                del results[category][package]
+
+        return self._results
+
+    def _classify_all(self, packages):
+        self.changes = None
+        self._labels = dict(packages)
+        self._index = _index_packages(packages)
+        self._classified = {name: list(_classify_entries(entries)) for name, entries in self._index.items()}
+
+        results = {DIFF: defaultdict(list), UNIQUE: defaultdict(list), SAME: defaultdict(list)}
+        for records in self._classified.values():
+            for category, package, label in records:
+                results[category][package].append(label)
+
+        self._results = results[DIFF], results[UNIQUE], results[SAME]
+        return self._results
+
+
+def _source_label(directory, filepath):
+    """
+    Name a source is reported under, the URL for downloads as cached files are
+    named by content.
+    """
+    location = _requirements_location(directory)
+    return location if _is_url(location) else filepath
+
+
+class Stats:
+    """
+    Wall time per stage and per source plus counters collected during a
+    comparison.  Pass an instance to compare_reqs or _compare_reqs and read it
+    afterwards, as_dict gives a JSON friendly view.
+
+    Stages are 'load' (fetching and parsing every source), 'classify' and
+    'render', or 'analyze' and 'matrix' in place of 'classify' for
+    compatibility checks and drift matrices.  Streaming output formats
+    classify while writing, so both are recorded under 'render' for them.
+    Sources parsed in worker processes report no line counts or parse times.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.sources = {}
+        self.bytes_read = 0
+        self.lines_scanned = 0
+        self.packages_parsed = 0
+        self.comparisons = 0    # package names compared across sources
+        self.records = 0        # (category, package, source) records classified
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the wrapped block, adding to any time already recorded for name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def add_source(self, label, fetch=0.0, parse=0.0, bytes_read=0, lines=0, packages=0, cached=False):
+        """
+        Record how long a source took to fetch and parse and how much it held.
+        """
+        with self._lock:
+            self.sources[label] = {
+                'fetch': fetch,
+                'parse': parse,
+                'bytes_read': bytes_read,
+                'lines': lines,
+                'packages': packages,
+                'cached': cached,
+            }
+            self.bytes_read += bytes_read
+            self.lines_scanned += lines
+            self.packages_parsed += packages
+
+    def add_results(self, diff_packages, unique_packages, same_packages):
+        """
+        Count the names and records in classified results.
+        """
+        results = (diff_packages, unique_packages, same_packages)
+        self.comparisons += len({package.canonical_name for packages in results for package in packages})
+        self.records += sum(len(filepaths) for packages in results for filepaths in packages.values())
+
+    def count_records(self, records):
+        """
+        Count names and records while passing streamed records through.
+        """
+        names = set()
+        try:
+            for category, package, filepath in records:
+                names.add(package.canonical_name)
+                self.records += 1
+                yield category, package, filepath
+        finally:
+            # consumers such as a limit may stop before the records run out
+            self.comparisons += len(names)
+
+    def as_dict(self):
+        return {
+            'stages': dict(self.stages),
+            'sources': {label: dict(values) for label, values in self.sources.items()},
+            'bytes_read': self.bytes_read,
+            'lines_scanned': self.lines_scanned,
+            'packages_parsed': self.packages_parsed,
+            'comparisons': self.comparisons,
+            'records': self.records,
+        }
+
+    def __str__(self):
+        lines = [f'{stage:<10} {elapsed:>9.4f}s' for stage, elapsed in self.stages.items()]
+        lines.append(f'{"sources":<10} {len(self.sources):>9}')
+        lines.append(f'{"bytes":<10} {self.bytes_read:>9}')
+        lines.append(f'{"lines":<10} {self.lines_scanned:>9}')
+        lines.append(f'{"packages":<10} {self.packages_parsed:>9}')
+        lines.append(f'{"names":<10} {self.comparisons:>9}')
+        lines.append(f'{"records":<10} {self.records:>9}')
+        for label, values in self.sources.items():
+            cached = ' (cached)' if values['cached'] else ''
+            lines.append(f'  {label}: fetch {values["fetch"]:.4f}s parse {values["parse"]:.4f}s '
+                         f'{values["lines"]} lines {values["packages"]} packages{cached}')
+        return '\n'.join(lines)
+
+
+def _stage(stats, name):
+    """
+    Time a stage when stats are being collected.
+    """
+    return stats.stage(name) if stats is not None else nullcontext()
+
+
+def _is_adapter(directory):
+    return directory == STDIN_SOURCE or directory.startswith((INSTALLED_SOURCE, VENV_SOURCE))
+
+
+def _unique_names(packages):
+    """
+    First package for every name, as only the first distribution found on
+    the path is imported.
+    """
+    unique = {}
+    for package in packages:
+        unique.setdefault(package.canonical_name, package)
+    return tuple(unique.values())
+
+
+def _installed_packages():
+    """
+    Distributions installed for the running interpreter.
+    """
+    from importlib import metadata
+
+    for distribution in metadata.distributions():
+        name = distribution.metadata['Name']
+        if name:
+            yield _package(name, distribution.version, '==')
+
+
+def _read_metadata(filepath):
+    """
+    Name and version from the headers of a METADATA or PKG-INFO file, reading
+    no further than the headers.
+    """
+    name = version = None
+    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if not line.strip():
+                break
+            if line.startswith('Name:'):
+                name = line[5:].strip()
+            elif line.startswith('Version:'):
+                version = line[8:].strip()
+            if name and version:
+                break
+    return name, version
+
+
+def _site_packages(venv_path):
+    """
+    site-packages directories of a virtual environment, or the directory
+    itself when it is one.
+    """
+    patterns = ('lib/python*/site-packages', 'lib64/python*/site-packages', 'Lib/site-packages')
+    directories = sorted({
+        os.path.realpath(directory)
+        for pattern in patterns
+        for directory in glob.glob(os.path.join(glob.escape(venv_path), pattern))
+    })
+    if directories:
+        return directories
+    if os.path.isdir(venv_path) and any(entry.endswith('.dist-info') for entry in os.listdir(venv_path)):
+        return [venv_path]
+    raise ValueError(f"No site-packages found in {venv_path}")
+
+
+def _venv_packages(venv_path):
+    """
+    Distributions installed in another environment, read from their
+    .dist-info or .egg-info metadata without running its interpreter.
+    """
+    for site_packages in _site_packages(venv_path):
+        for entry in sorted(os.listdir(site_packages), key=str.lower):
+            path = os.path.join(site_packages, entry)
+            if entry.endswith('.dist-info'):
+                path = os.path.join(path, 'METADATA')
+            elif entry.endswith('.egg-info') and os.path.isdir(path):
+                path = os.path.join(path, 'PKG-INFO')
+            elif not entry.endswith('.egg-info'):
+                continue
+
+            try:
+                name, version = _read_metadata(path)
+            except OSError:
+                continue
+            if name:
+                yield _package(name, version, '==' if version else None)
+
+
+def _load_adapter(directory, pep508=False, stats=None):
+    """
+    Read packages from a source that is not a requirements file: installed:
+    for the running interpreter, venv:PATH for another environment and - for
+    requirements piped to stdin, whose -r and -c options are not followed.
+
+    # param directory: (str) adapter source
+    # param pep508: (bool) parse requirements read from stdin as described in PEP 508
+    # param stats: (Stats) records read timings for the source
+    # return: (tuple) source label, tuple of packages
+    """
+    start = time.perf_counter()
+    if directory == STDIN_SOURCE:
+        label = STDIN_LABEL
+        lines = (line for line in sys.stdin if line[:1].isalpha())
+        package_set = tuple(dict.fromkeys(_iter_line_packages(lines, pep508=pep508)))
+    elif directory.startswith(INSTALLED_SOURCE):
+        label = directory
+        package_set = _unique_names(_installed_packages())
+    else:
+        label = directory
+        package_set = _unique_names(_venv_packages(directory[len(VENV_SOURCE):]))
+
+    if stats is not None:
+        stats.add_source(label, parse=time.perf_counter() - start, packages=len(package_set))
+    return label, package_set
+
+
+def _source_url(directory):
+    location = _requirements_location(directory)
+    return location if _is_url(location) else None
+
+
+def _load_source(directory, graph, pep508=False, stats=None):
+    """
+    Resolve and parse a single requirements source along with the files it
+    includes.
+
+    # param directory: (str) directory, file path or URL
+    # param graph: (_RequirementsGraph) files parsed so far during the run
+    # param pep508: (bool) parse sources that are not files as described in PEP 508,
+    #   the graph's parser is used for files
+    # param stats: (Stats) records fetch and parse timings for the source
+    # return: (tuple) source label, tuple of packages
+    """
+    if _is_adapter(directory):
+        return _load_adapter(directory, pep508=pep508, stats=stats)
+
+    if stats is None:
+        filepath = _establish_filepath(directory)
+        return _source_label(directory, filepath), graph.resolve(filepath, _source_url(directory))
+
+    start = time.perf_counter()
+    filepath = _establish_filepath(directory)
+    fetched = time.perf_counter()
+
+    # lines of included files parsed for this source are counted too
+    counts = {}
+    package_set = graph.resolve(filepath, _source_url(directory), counts=counts)
+
+    label = _source_label(directory, filepath)
+    stats.add_source(
+        label,
+        fetch=fetched - start,
+        parse=time.perf_counter() - fetched,
+        bytes_read=os.path.getsize(filepath) if counts else 0,
+        lines=counts.get('lines', 0),
+        packages=len(package_set),
+        cached=not counts,
+    )
+    return label, package_set
+
+
+def _load_packages(directories, workers=None, use_processes=False, snapshot=None, use_mmap=False, pep508=False,
+                   stats=None):
+    """
+    Fetch and parse all requirements sources, concurrently when more than one
+    worker is requested.  Threads are used for fetching and, unless processes
+    are requested for very large files, parsing as well.  Results are merged in
+    input order regardless of which source finishes first.  Files included by
+    several sources are parsed once for the whole run.
+
+    # param directories: (list) directories, file paths, URLs or installed:, venv:PATH and - sources
+    # param workers: (int) number of concurrent workers, serial when not set
+    # param use_processes: (bool) parse in a process pool instead of threads
+    # param snapshot: (SnapshotStore) reuse parse results of unchanged files
+    # param use_mmap: (bool) read files through memory mappings
+    # param pep508: (bool) parse requirements fully as described in PEP 508
+    # param stats: (Stats) records per source timings and counts
+    # return: (dict) source label -> tuple of packages, in input order
+    """
+    parse = functools.partial(_parse_file, use_mmap=use_mmap, pep508=pep508)
+    if snapshot is not None:
+        snapshot.use_parser('pep508' if pep508 else 'basic')
+    graph = _RequirementsGraph(parse, snapshot=snapshot)
+    load_source = functools.partial(_load_source, graph=graph, pep508=pep508, stats=stats)
+    if not workers or workers <= 1:
+        return dict(load_source(directory) for directory in directories)
+
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    files = [directory for directory in directories if not _is_adapter(directory)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if not use_processes:
+            return dict(executor.map(load_source, directories))
+        filepaths = dict(zip(files, executor.map(_establish_filepath, files)))
+
+    # the sources themselves are parsed in worker processes, files they
+    # include are then parsed here while resolving
+    paths = [os.path.abspath(filepath) for filepath in dict.fromkeys(filepaths.values())]
+    stale = paths if snapshot is None else [path for path in paths if snapshot.is_stale(path)]
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, parsed in zip(stale, executor.map(parse, stale)):
+                if snapshot is not None:
+                    snapshot.record(path, parsed)
+                graph.add(path, parsed)
+
+    packages = {}
+    for directory in directories:
+        if _is_adapter(directory):
+            label, package_set = _load_adapter(directory, pep508=pep508, stats=stats)
+            packages[label] = package_set
+            continue
+
+        filepath = filepaths[directory]
+        label = _source_label(directory, filepath)
+        packages[label] = graph.resolve(filepath, _source_url(directory))
+        if stats is not None:
+            stats.add_source(label, bytes_read=os.path.getsize(filepath), packages=len(packages[label]))
+    return packages
+
+
+def _check_directories(directories):
+    if not directories:
+        raise ValueError("No directories provided")
+    elif len(directories) == 1:
+        raise ValueError("Only one directory provided")
+
+
+def _compare_reqs(*directories, workers=None, use_processes=False, snapshot=None, use_mmap=False, pep508=False,
+                  compact=False, stats=None):
+    """
+    Compare requirements.txt files in directories.  More than 1 required for comparison.
+    Setup as internal function to allow for easier testing.
+
+    # param directories: (list) list of directories to compare
+    # param workers: (int) number of workers used to fetch and parse concurrently
+    # param use_processes: (bool) parse in a process pool instead of threads
+    # param snapshot: (SnapshotStore|str) snapshot store or path to persist one at, makes
+    #   the comparison incremental; results are shared with the store between runs
+    # param use_mmap: (bool) read files through memory mappings, for very large files
+    # param pep508: (bool) parse extras, markers and multi clause specifiers as described in PEP 508
+    # param compact: (bool) return a CompactResult, classified straight into its columns
+    # param stats: (Stats) collects per stage and per source timings and counts
+    # return: (tuple|CompactResult) tuple of package results
+    """
+    _check_directories(directories)
+
+    store = None
+    if snapshot is not None:
+        store = snapshot if isinstance(snapshot, SnapshotStore) else SnapshotStore(snapshot)
+
+    with _stage(stats, 'load'):
+        packages = _load_packages(
+            directories, workers=workers, use_processes=use_processes, snapshot=store, use_mmap=use_mmap,
+            pep508=pep508, stats=stats,
+        )
+
+    with _stage(stats, 'classify'):
+        if compact:
+            records = _iter_classified(packages) if store is None else _iter_results(*store.classify(packages))
+            results = CompactResult.from_records(records if stats is None else stats.count_records(records))
+        else:
+            results = _classify_packages(packages) if store is None else store.classify(packages)
+    if stats is not None and not compact:
+        stats.add_results(*results)
+
+    if store is not None:
+        store.save()
+    return results
+
+
+def _iter_results(diff_packages, unique_packages, same_packages):
+    """
+    Flatten package results back into (category, package, filepath) records.
+    """
+    for category, results in ((DIFF, diff_packages), (UNIQUE, unique_packages), (SAME, same_packages)):
+        for package, filepaths in results.items():
+            for filepath in filepaths:
+                yield category, package, filepath
+
+
+def _iter_compare_reqs(*directories, workers=None, use_processes=False, snapshot=None, use_mmap=False, pep508=False,
+                       stats=None):
+    """
+    Load requirements files and return a generator yielding each (category,
+    package, filepath) record as soon as its package name is classified,
+    without building the result dicts first.  Loading happens up front, so
+    invalid sources raise here rather than when iterating.  Takes the same
+    arguments as _compare_reqs.
+
+    # return: (generator) (category, package, filepath) records
+    """
+    _check_directories(directories)
+
+    if snapshot is not None:
+        return _iter_results(*_compare_reqs(
+            *directories, workers=workers, use_processes=use_processes, snapshot=snapshot, use_mmap=use_mmap,
+            pep508=pep508, stats=stats,
+        ))
+
+    with _stage(stats, 'load'):
+        packages = _load_packages(
+            directories, workers=workers, use_processes=use_processes, use_mmap=use_mmap, pep508=pep508, stats=stats
+        )
+    records = _iter_classified(packages)
+    return records if stats is None else stats.count_records(records)
+
+
+def _check_compatibility(*directories, workers=None, use_processes=False, use_mmap=False, pep508=False, stats=None):
+    """
+    Find packages whose version specifiers across requirements files have no
+    version in common, rather than packages that are merely written
+    differently.  Takes the same loading arguments as _compare_reqs.
+
+    # return: (dict) canonical package name -> {filepath: [packages]} for conflicting names
+    """
+    _check_directories(directories)
+
+    with _stage(stats, 'load'):
+        packages = _load_packages(
+            directories, workers=workers, use_processes=use_processes, use_mmap=use_mmap, pep508=pep508, stats=stats
+        )
+    with _stage(stats, 'analyze'):
+        return _find_conflicts(packages)
+
+
+async def _load_packages_async(directories, concurrency=DEFAULT_CONCURRENCY, host_connections=DEFAULT_HOST_CONNECTIONS,
+                               timeout=DEFAULT_TIMEOUT, use_mmap=False, pep508=False):
+    """
+    Fetch and parse all requirements sources without blocking the event loop.
+    Blocking fetches and file reads run in the loop's default executor, at
+    most concurrency at a time and host_connections at a time per host, and
+    each fetch is abandoned after timeout seconds, which is also its socket
+    timeout.  Files reached through URL includes are fetched while resolving,
+    outside the per host limit.
+
+    # param directories: (list) directories, file paths or URLs
+    # param concurrency: (int) most sources fetched or parsed at once
+    # param host_connections: (int) most concurrent fetches from a single host
+    # param timeout: (float) seconds a single fetch may take
+    # param use_mmap: (bool) read files through memory mappings
+    # param pep508: (bool) parse requirements fully as described in PEP 508
+    # return: (dict) source label -> tuple of packages, in input order
+    """
+    import asyncio
+    import socket
+
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(concurrency)
+    host_limits = {}
+    graph = _RequirementsGraph(functools.partial(_parse_file, use_mmap=use_mmap, pep508=pep508))
+
+    async def establish(directory, url):
+        if url is None:
+            return await loop.run_in_executor(None, _establish_filepath, directory)
+
+        # the host slot is taken first so sources waiting on a busy host do
+        # not hold slots other hosts could use
+        host_limit = host_limits.setdefault(urllib.parse.urlsplit(url).netloc, asyncio.Semaphore(host_connections))
+        await host_limit.acquire()
+        try:
+            await limit.acquire()
+        except BaseException:
+            host_limit.release()
+            raise
+
+        def release(future):
+            if not future.cancelled():
+                # nobody awaits a download that failed after timing out
+                future.exception()
+            limit.release()
+            host_limit.release()
+
+        # waiting is abandoned after timeout, but the slots are only given
+        # back once the download itself stops, which its socket timeout
+        # bounds, so a timed out download never overlaps the next one
+        fetch = loop.run_in_executor(None, functools.partial(_establish_filepath, directory, timeout=timeout))
+        fetch.add_done_callback(release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(fetch), timeout)
+        except (asyncio.TimeoutError, socket.timeout):
+            raise ValueError(f"Timed out fetching {url}") from None
+
+    async def load(directory):
+        if _is_adapter(directory):
+            async with limit:
+                return await loop.run_in_executor(None, functools.partial(_load_adapter, directory, pep508=pep508))
+
+        url = _source_url(directory)
+        filepath = await establish(directory, url)
+        async with limit:
+            package_set = await loop.run_in_executor(None, graph.resolve, filepath, url)
+        return _source_label(directory, filepath), package_set
+
+    return dict(await asyncio.gather(*(load(directory) for directory in directories)))
+
+
+async def _compare_reqs_async(*directories, concurrency=DEFAULT_CONCURRENCY, host_connections=DEFAULT_HOST_CONNECTIONS,
+                              timeout=DEFAULT_TIMEOUT, use_mmap=False, pep508=False, stats=None):
+    """
+    Async counterpart of _compare_reqs for use inside an event loop, returning
+    the same results.  Loading is done as _load_packages_async describes and
+    classification also runs in the executor.  Stats only record stage times.
+
+    # param directories: (list) list of directories to compare
+    # param concurrency: (int) most sources fetched or parsed at once
+    # param host_connections: (int) most concurrent fetches from a single host
+    # param timeout: (float) seconds a single fetch may take
+    # param use_mmap: (bool) read files through memory mappings, for very large files
+    # param pep508: (bool) parse extras, markers and multi clause specifiers as described in PEP 508
+    # param stats: (Stats) collects per stage timings and counts
+    # return: (tuple) tuple of package results
+    """
+    import asyncio
+
+    _check_directories(directories)
+
+    with _stage(stats, 'load'):
+        packages = await _load_packages_async(
+            directories, concurrency=concurrency, host_connections=host_connections, timeout=timeout,
+            use_mmap=use_mmap, pep508=pep508,
+        )
+    with _stage(stats, 'classify'):
+        results = await asyncio.get_running_loop().run_in_executor(None, _classify_packages, packages)
+    if stats is not None:
+        stats.add_results(*results)
+    return results
+
+
+def _name_matcher(names):
+    """
+    Predicate matching packages against glob patterns or compiled regular
+    expressions, tried against the name as written and its canonical form.
+    Globs match the whole name, compiled patterns match anywhere in it.
+
+    # param names: (iterable) glob strings or compiled patterns, None to match all
+    # return: (callable) package -> bool, None when names is None
+    """
+    if names is None:
+        return None
+
+    # translated globs are anchored at the end only, so they are matched rather than searched
+    matchers = [
+        name.search if isinstance(name, re.Pattern) else re.compile(fnmatch.translate(name), re.IGNORECASE).match
+        for name in names
+    ]
+    return lambda package: any(
+        matches(package.name) or matches(package.canonical_name) for matches in matchers
+    )
+
+
+def _source_label_key(source):
+    """
+    Key a source given the way it is on the command line is compared on, the
+    same for the label its results are reported under.  A directory stands
+    for its requirements.txt and local paths are made absolute, so ./a and a
+    select the same results.
+
+    # param source: (str) directory, file path, URL, adapter source or source label
+    # return: (str) comparison key
+    """
+    if source in (STDIN_SOURCE, STDIN_LABEL):
+        return STDIN_LABEL
+    if _is_adapter(source):
+        return source
+    location = _requirements_location(source)
+    if _is_url(location):
+        return location
+    return os.path.normpath(os.path.abspath(location))
+
+
+def _check_sources(sources, directories):
+    """
+    Raise ValueError for any of sources that is not being compared, rather
+    than quietly showing nothing for it.
+
+    # param sources: (iterable) sources to show results of, None to show all
+    # param directories: (iterable) sources being compared
+    """
+    if sources is None:
+        return
+
+    compared = {_source_label_key(directory) for directory in directories}
+    missing = [source for source in sources if _source_label_key(source) not in compared]
+    if missing:
+        raise ValueError(f"Not among the compared sources: {', '.join(missing)}")
+
+
+def _source_matcher(sources):
+    """
+    Predicate keeping results of the given sources.
+
+    # param sources: (iterable) directories, file paths, URLs or adapter sources, None to keep all
+    # return: (callable) source label -> bool, None when sources is None
+    """
+    if sources is None:
+        return None
+
+    keys = {_source_label_key(source) for source in sources}
+
+    # labels repeat for every record, so each is only normalized once
+    memo = {}
+
+    def matches(label):
+        keep = memo.get(label)
+        if keep is None:
+            keep = memo[label] = _source_label_key(label) in keys
+        return keep
+
+    return matches
+
+
+def _select_packages(packages, name_matches=None, source_matches=None, limit=None):
+    """
+    Filter package results and put the first of them in order.  Filters run
+    before anything is formatted, and with a limit only that many packages
+    are picked from a heap instead of sorting every package.
+
+    # param packages: (dict) package -> list of filepaths
+    # param name_matches: (callable) package -> bool, all packages if not set
+    # param source_matches: (callable) filepath -> bool, all filepaths if not set
+    # param limit: (int) most packages to return
+    # return: (list) (package, filepaths) in package order
+    """
+    items = packages.items()
+    if name_matches is not None:
+        items = (item for item in items if name_matches(item[0]))
+    if source_matches is not None:
+        items = (
+            (package, [filepath for filepath in filepaths if source_matches(filepath)])
+            for package, filepaths in items
+        )
+        items = (item for item in items if item[1])
+
+    if limit is None:
+        return sorted(items, key=lambda item: item[0].sort_key)
+    return heapq.nsmallest(limit, items, key=lambda item: item[0].sort_key)
+
+
+def _print_table(diff_packages, unique_packages, same_packages, show_diff_versions,
+                 show_unique, show_same, remove_spaces, stream=None, names=None, sources=None, limit=None):
+    """
+    Prints table of packages comparison results.
+
+    :param diff_packages: (dict) packages with different versions
+    :param unique_packages: (dict) packages unique to directory
+    :param same_packages: (dict) packages with same versions
+    :param show_diff_versions: (bool) show packages with different versions
+    :param show_unique: (bool) show packages unique to directory
+    :param show_same: (bool) show packages with same versions
+    :param remove_spaces: (bool) remove spaces from package versions
+    :param stream: (file) file-like object to print to, stdout if not set
+    :param names: (list) glob strings or compiled patterns, only matching packages are shown
+    :param sources: (iterable) only rows for these directories are shown
+    :param limit: (int) most rows shown per section
+    """
+    from art import text2art
+
+    select = functools.partial(
+        _select_packages, name_matches=_name_matcher(names), source_matches=_source_matcher(sources), limit=limit
+    )
+
+    print(text2art("Package  Comparison", font="small"), file=stream)
+    print(f"Show Diff Package Versions:   {show_diff_versions}", file=stream)
+    print(f"Show Unique Packages:         {show_unique}", file=stream)
+    print(f"Show Shared Packages:         {show_same}", file=stream)
+    print(file=stream)
+
+    if show_diff_versions:
+        print("Packages with different versions across directories:", file=stream)
+        # every package has a row per directory, so the limit is on rows
+        rows = ((package, filepath) for package, filepaths in select(diff_packages) for filepath in filepaths)
+        for package, filepath in itertools.islice(rows, limit):
+            package_str = str(package)
+            if remove_spaces:
+                package_str = str(package).replace(" ", "")
+            print(f'{package_str.ljust(30)} - {filepath}', file=stream)
+        print(file=stream)
+
+    if show_unique:
+        print("Packages only found in a specific directory:", file=stream)
+        for package, filepaths in select(unique_packages):
+            package_str = str(package)
+            if remove_spaces:
+                package_str = package_str.replace(" ", "")
+            print(f'{package_str.ljust(30)} - {filepaths[0]}', file=stream)
+        print(file=stream)
+
+    if show_same:
+        print("Packages with same versions across directories:", file=stream)
+        for package, filepaths in select(same_packages):
+            package_str = str(package)
+            if remove_spaces:
+                package_str = package_str.replace(" ", "")
+            print(f'{package_str}', file=stream)
+        print(file=stream)
+
+
+def _compare_matrix(*directories, workers=None, use_processes=False, use_mmap=False, pep508=False, jaccard=False,
+                    stats=None):
+    """
+    Load requirements files and count shared, same, different and unique
+    packages between every pair of them.  Takes the same loading arguments as
+    _compare_reqs.
+
+    # param jaccard: (bool) include the jaccard similarity of every pair
+    # return: (dict) drift matrix as returned by _drift_matrix
+    """
+    _check_directories(directories)
+
+    with _stage(stats, 'load'):
+        packages = _load_packages(
+            directories, workers=workers, use_processes=use_processes, use_mmap=use_mmap, pep508=pep508, stats=stats
+        )
+    with _stage(stats, 'matrix'):
+        return _drift_matrix(packages, jaccard=jaccard)
+
+
+def _print_changes(removed, added, categories, remove_spaces, stream=None):
+    """
+    Prints records that left or entered the comparison results, e.g. after a
+    watched file changed.
+
+    :param removed: (list) (category, package, filepath) records no longer in the results
+    :param added: (list) (category, package, filepath) records new to the results
+    :param categories: (set) categories to print, others are skipped
+    :param remove_spaces: (bool) remove spaces from package versions
+    :param stream: (file) file-like object to print to, stdout if not set
+    """
+    changes = [('-', record) for record in removed] + [('+', record) for record in added]
+    changes.sort(key=lambda change: (change[1][1].sort_key, change[0]))
+    for sign, (category, package, filepath) in changes:
+        if category not in categories:
+            continue
+        package_str = str(package)
+        if remove_spaces:
+            package_str = package_str.replace(" ", "")
+        print(f'{sign} {category:<6} {package_str.ljust(30)} - {filepath}', file=stream)
+
+
+def _print_conflicts(conflicts, remove_spaces, stream=None):
+    """
+    Prints packages whose versions cannot be satisfied across directories.
+
+    :param conflicts: (dict) canonical package name -> {filepath: [packages]}
+    :param remove_spaces: (bool) remove spaces from package versions
+    :param stream: (file) file-like object to print to, stdout if not set
+    """
+    print("Packages with no version satisfying every directory:", file=stream)
+    for name in sorted(conflicts):
+        for filepath, package_list in conflicts[name].items():
+            for package in package_list:
+                package_str = str(package)
+                if remove_spaces:
+                    package_str = package_str.replace(" ", "")
+                print(f'{package_str.ljust(30)} - {filepath}', file=stream)
+    print(file=stream)
+
+
+class _JsonLinesWriter:
+    """
+    Writes one JSON object per package record.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, category, package, filepath):
+        self.stream.write(json.dumps(_record_dict(category, package, filepath)) + '\n')
+
+    def close(self):
+        self.stream.flush()
+
+
+class _CsvWriter:
+    """
+    Writes package records as CSV rows below a header row.  Extras are
+    joined by commas, extras and marker are empty unless parsed as PEP 508.
+    """
+    FIELDS = ('category', 'name', 'version_spec', 'version', 'source', 'extras', 'marker')
+
+    def __init__(self, stream):
+        import csv
+
+        self.stream = stream
+        self._writer = csv.writer(stream)
+        self._writer.writerow(self.FIELDS)
+
+    def write(self, category, package, filepath):
+        self._writer.writerow((
+            category, package.name, package.version_spec or '', package.version or '', filepath,
+            ','.join(package.extras or ()), package.marker or '',
+        ))
+
+    def close(self):
+        self.stream.flush()
+
+
+class _JsonSummaryWriter:
+    """
+    Writes a single JSON document with per category and per source counts
+    once all records have been seen.  Only counters are kept in memory.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._categories = {DIFF: 0, UNIQUE: 0, SAME: 0}
+        self._names = {DIFF: set(), UNIQUE: set(), SAME: set()}
+        self._sources = {}
+
+    def write(self, category, package, filepath):
+        self._categories[category] += 1
+        self._names[category].add(package.canonical_name)
+        source = self._sources.setdefault(filepath, {DIFF: 0, UNIQUE: 0, SAME: 0})
+        source[category] += 1
+
+    def close(self):
+        summary = {
+            'records': self._categories,
+            'packages': {category: len(names) for category, names in self._names.items()},
+            'sources': self._sources,
+        }
+        json.dump(summary, self.stream)
+        self.stream.write('\n')
+        self.stream.flush()
+
+
+def _record_dict(category, package, filepath):
+    record = {
+        'category': category,
+        'name': package.name,
+        'version_spec': package.version_spec,
+        'version': package.version,
+        'source': filepath,
+    }
+    # only packages parsed as PEP 508 carry extras and markers
+    if package.extras:
+        record['extras'] = list(package.extras)
+    if package.marker is not None:
+        record['marker'] = package.marker
+    return record
+
+
+# machine readable output formats, the ascii table is rendered by _print_table
+OUTPUT_TABLE = 'table'
+OUTPUT_WRITERS = {
+    'jsonl': _JsonLinesWriter,
+    'csv': _CsvWriter,
+    'json': _JsonSummaryWriter,
+}
+
+
+def _write_records(records, output_format, stream, categories, names=None, sources=None, limit=None):
+    """
+    Stream records through the writer for output_format.
+
+    # param records: (iterable) (category, package, filepath) records
+    # param output_format: (str) one of OUTPUT_WRITERS
+    # param stream: (file) file-like object to write to
+    # param categories: (set) categories to write, others are skipped
+    # param names: (list) glob strings or compiled patterns, only matching packages are written
+    # param sources: (iterable) only records of these directories are written
+    # param limit: (int) most records written, in the order they are classified
+    """
+    name_matches = _name_matcher(names)
+    source_matches = _source_matcher(sources)
+    records = (
+        (category, package, filepath) for category, package, filepath in records
+        if category in categories and (source_matches is None or source_matches(filepath))
+        and (name_matches is None or name_matches(package))
+    )
+
+    writer = OUTPUT_WRITERS[output_format](stream)
+    for category, package, filepath in itertools.islice(records, limit):
+        writer.write(category, package, filepath)
+    writer.close()
+
+
+MATRIX_FIELDS = ('shared', 'same', 'different')
+
+
+def _iter_matrix_pairs(matrix):
+    """
+    Flatten a drift matrix into one dict per pair of files, each pair once.
+    """
+    sources = matrix['sources']
+    for i, left in enumerate(sources):
+        for j in range(i + 1, len(sources)):
+            pair = {'left': left, 'right': sources[j]}
+            for field in MATRIX_FIELDS:
+                pair[field] = matrix[field][i][j]
+            pair['unique_left'] = matrix['unique'][i][j]
+            pair['unique_right'] = matrix['unique'][j][i]
+            if 'jaccard' in matrix:
+                pair['jaccard'] = matrix['jaccard'][i][j]
+            yield pair
+
+
+def _write_matrix(matrix, output_format, stream):
+    """
+    Write a drift matrix as JSON matrices, or one CSV row, JSON line or
+    table row per pair of files.
+
+    # param matrix: (dict) drift matrix as returned by _drift_matrix
+    # param output_format: (str) 'table', 'json', 'jsonl' or 'csv'
+    # param stream: (file) file-like object to write to
+    """
+    if output_format == 'json':
+        json.dump(matrix, stream)
+        stream.write('\n')
+    elif output_format == 'jsonl':
+        for pair in _iter_matrix_pairs(matrix):
+            stream.write(json.dumps(pair) + '\n')
+    elif output_format == 'csv':
+        import csv
+
+        fields = ['left', 'right', *MATRIX_FIELDS, 'unique_left', 'unique_right']
+        if 'jaccard' in matrix:
+            fields.append('jaccard')
+        writer = csv.DictWriter(stream, fields)
+        writer.writeheader()
+        writer.writerows(_iter_matrix_pairs(matrix))
+    else:
+        print("Drift between every pair of directories:", file=stream)
+        for pair in _iter_matrix_pairs(matrix):
+            counts = ' '.join(f'{field} {pair[field]}' for field in MATRIX_FIELDS)
+            line = f'{pair["left"]} <-> {pair["right"]}: {counts} ' \
+                   f'unique {pair["unique_left"]}/{pair["unique_right"]}'
+            if 'jaccard' in pair:
+                line += f' jaccard {pair["jaccard"]:.3f}'
+            print(line, file=stream)
+        print(file=stream)
+    stream.flush()
+
+
+@contextmanager
+def _profiled(profile):
+    """
+    Capture a cProfile of the wrapped block to the given path, if any.  Only
+    the calling thread is profiled.
+    """
+    if not profile:
+        yield
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile)
+
+
+def compare_reqs(*directories, show_diff_versions=True, show_same=False, show_unique=False, remove_spaces=False,
+                 workers=None, use_processes=False, snapshot=None, output_format=OUTPUT_TABLE, stream=None,
+                 use_mmap=False, pep508=False, stats=None, profile=None, names=None, sources=None, limit=None):
+    """
+    Prints table of packages comparison results, or streams them in a machine
+    readable output format.
+
+    # param directories: (list) list of directories to compare
+    # param show_diff_versions: (bool) show packages with different versions
+    # param show_same: (bool) show packages with same versions
+    # param show_unique: (bool) show packages unique to directory
+    # param remove_spaces: (bool) remove spaces from package versions
+    # param workers: (int) number of workers used to fetch and parse concurrently
+    # param use_processes: (bool) parse in a process pool instead of threads
+    # param snapshot: (SnapshotStore|str) snapshot store or path, re-parses only changed files
+    # param output_format: (str) 'table' or one of 'jsonl', 'csv', 'json'
+    # param stream: (file) file-like object to write to, stdout if not set
+    # param use_mmap: (bool) read files through memory mappings, for very large files
+    # param pep508: (bool) parse extras, markers and multi clause specifiers as described in PEP 508
+    # param stats: (Stats) collects per stage and per source timings and counts
+    # param profile: (str) path to write a cProfile capture of the comparison to
+    # param names: (list) glob strings or compiled patterns, only matching packages are shown
+    # param sources: (iterable) only results for these directories are shown
+    # param limit: (int) most rows shown per table section, or records written for other formats
+    """
+    if output_format != OUTPUT_TABLE and output_format not in OUTPUT_WRITERS:
+        raise ValueError(f"Unknown output format {output_format}")
+    _check_sources(sources, directories)
+
+    filters = {'names': names, 'sources': sources, 'limit': limit}
+    options = {
+        'workers': workers,
+        'use_processes': use_processes,
+        'snapshot': snapshot,
+        'use_mmap': use_mmap,
+        'pep508': pep508,
+        'stats': stats,
+    }
+    try:
+        with _profiled(profile):
+            if output_format != OUTPUT_TABLE:
+                categories = {
+                    category
+                    for category, shown in ((DIFF, show_diff_versions), (UNIQUE, show_unique), (SAME, show_same))
+                    if shown
+                }
+                records = _iter_compare_reqs(*directories, **options)
+                with _stage(stats, 'render'):
+                    _write_records(records, output_format, stream or sys.stdout, categories, **filters)
+                return True
+
+            diff_packages, unique_packages, same_packages = _compare_reqs(*directories, **options)
+
+            # split internal and public methods to allow for testing and utilize this method to print
+            with _stage(stats, 'render'):
+                _print_table(diff_packages, unique_packages, same_packages, show_diff_versions,
+                             show_unique, show_same, remove_spaces, stream=stream, **filters)
+    except ValueError as e:
+        raise e
+    except Exception as e:
+        print(e)
+        return False
+
+    return True
+
+
+async def compare_reqs_async(*directories, show_diff_versions=True, show_same=False, show_unique=False,
+                             remove_spaces=False, concurrency=DEFAULT_CONCURRENCY,
+                             host_connections=DEFAULT_HOST_CONNECTIONS, timeout=DEFAULT_TIMEOUT,
+                             output_format=OUTPUT_TABLE, stream=None, use_mmap=False, pep508=False, stats=None,
+                             names=None, sources=None, limit=None):
+    """
+    Async counterpart of compare_reqs that never blocks the event loop, for
+    services comparing URLs and files from within asyncio.
+
+    # param directories: (list) list of directories to compare
+    # param show_diff_versions: (bool) show packages with different versions
+    # param show_same: (bool) show packages with same versions
+    # param show_unique: (bool) show packages unique to directory
+    # param remove_spaces: (bool) remove spaces from package versions
+    # param concurrency: (int) most sources fetched or parsed at once
+    # param host_connections: (int) most concurrent fetches from a single host
+    # param timeout: (float) seconds a single fetch may take
+    # param output_format: (str) 'table' or one of 'jsonl', 'csv', 'json'
+    # param stream: (file) file-like object to write to, stdout if not set
+    # param use_mmap: (bool) read files through memory mappings, for very large files
+    # param pep508: (bool) parse extras, markers and multi clause specifiers as described in PEP 508
+    # param stats: (Stats) collects per stage timings and counts
+    # param names: (list) glob strings or compiled patterns, only matching packages are shown
+    # param sources: (iterable) only results for these directories are shown
+    # param limit: (int) most rows shown per table section, or records written for other formats
+    """
+    import asyncio
+
+    filters = {'names': names, 'sources': sources, 'limit': limit}
+    if output_format != OUTPUT_TABLE and output_format not in OUTPUT_WRITERS:
+        raise ValueError(f"Unknown output format {output_format}")
+    _check_sources(sources, directories)
+
+    try:
+        results = await _compare_reqs_async(
+            *directories, concurrency=concurrency, host_connections=host_connections, timeout=timeout,
+            use_mmap=use_mmap, pep508=pep508, stats=stats,
+        )
+
+        if output_format != OUTPUT_TABLE:
+            categories = {
+                category
+                for category, shown in ((DIFF, show_diff_versions), (UNIQUE, show_unique), (SAME, show_same))
+                if shown
+            }
+            render = functools.partial(
+                _write_records, _iter_results(*results), output_format, stream or sys.stdout, categories, **filters
+            )
+        else:
+            render = functools.partial(
+                _print_table, *results, show_diff_versions, show_unique, show_same, remove_spaces, stream=stream,
+                **filters
+            )
+        with _stage(stats, 'render'):
+            await asyncio.get_running_loop().run_in_executor(None, render)
+    except ValueError as e:
         raise e
     except Exception as e:
         print(e)
         return False
 
     return True
+
+
+def check_compatibility(*directories, remove_spaces=False, workers=None, use_processes=False, stream=None,
+                        use_mmap=False, pep508=False, stats=None, profile=None):
+    """
+    Prints packages whose version specifiers across directories cannot be
+    satisfied together, e.g. numpy>=1.22 and numpy<1.20, while numpy>=1.19
+    and numpy==1.22.2 are compatible.
+
+    # param directories: (list) list of directories to check
+    # param remove_spaces: (bool) remove spaces from package versions
+    # param workers: (int) number of workers used to fetch and parse concurrently
+    # param use_processes: (bool) parse in a process pool instead of threads
+    # param stream: (file) file-like object to write to, stdout if not set
+    # param use_mmap: (bool) read files through memory mappings, for very large files
+    # param pep508: (bool) parse extras, markers and multi clause specifiers as described in PEP 508
+    # param stats: (Stats) collects per stage and per source timings and counts
+    # param profile: (str) path to write a cProfile capture of the check to
+    # return: (bool) True if every package can be satisfied
+    """
+    try:
+        with _profiled(profile):
+            conflicts = _check_compatibility(
+                *directories, workers=workers, use_processes=use_processes, use_mmap=use_mmap, pep508=pep508,
+                stats=stats,
+            )
+            with _stage(stats, 'render'):
+                _print_conflicts(conflicts, remove_spaces, stream=stream)
+    except ValueError as e:
+        raise e
+    except Exception as e:
+        print(e)
+        return False
+
+    return not conflicts
+
+
+def drift_matrix(*directories, jaccard=False, output_format=OUTPUT_TABLE, stream=None, workers=None,
+                 use_processes=False, use_mmap=False, pep508=False, stats=None, profile=None):
+    """
+    Writes how far apart every pair of directories is: packages listed by
+    both, listed identically, listed with different versions and listed by
+    only one of them, computed in a single pass for all pairs.
+
+    # param directories: (list) list of directories to compare
+    # param jaccard: (bool) include the jaccard similarity of every pair
+    # param output_format: (str) 'table' or one of 'json', 'jsonl', 'csv'
+    # param stream: (file) file-like object to write to, stdout if not set
+    # param workers: (int) number of workers used to fetch and parse concurrently
+    # param use_processes: (bool) parse in a process pool instead of threads
+    # param use_mmap: (bool) read files through memory mappings, for very large files
+    # param pep508: (bool) parse extras, markers and multi clause specifiers as described in PEP 508
+    # param stats: (Stats) collects per stage and per source timings and counts
+    # param profile: (str) path to write a cProfile capture of the comparison to
+    """
+    if output_format != OUTPUT_TABLE and output_format not in OUTPUT_WRITERS:
+        raise ValueError(f"Unknown output format {output_format}")
+
+    try:
+        with _profiled(profile):
+            matrix = _compare_matrix(
+                *directories, workers=workers, use_processes=use_processes, use_mmap=use_mmap, pep508=pep508,
+                jaccard=jaccard, stats=stats,
+            )
+            with _stage(stats, 'render'):
+                _write_matrix(matrix, output_format, stream or sys.stdout)
+    except ValueError as e:
+        raise e
+    except Exception as e:
+        print(e)
+        return False
+
+    return True
+
+
+class Watcher:
+    """
+    Keeps a comparison up to date while its files are edited.  Local files,
+    including files reached through includes, are polled for changes to their
+    mtime and size; once no file has changed for the debounce period only the
+    changed files are parsed again, only the affected package names are
+    reclassified and only the records that changed are printed.  Sources
+    given as URLs are fetched once when watching starts.
+
+    Call run to watch until interrupted, or check to poll once.
+    """
+
+    def __init__(self, *directories, show_diff_versions=True, show_same=False, show_unique=False,
+                 remove_spaces=False, interval=1.0, debounce=0.5, workers=None, use_mmap=False, pep508=False,
+                 snapshot=None, stream=None, clock=time.monotonic):
+        _check_directories(directories)
+        self.directories = directories
+        self.show_diff_versions = show_diff_versions
+        self.show_same = show_same
+        self.show_unique = show_unique
+        self.remove_spaces = remove_spaces
+        self.interval = interval
+        self.debounce = debounce
+        self.stream = stream
+        self.clock = clock
+        self.categories = {
+            category
+            for category, shown in ((DIFF, show_diff_versions), (UNIQUE, show_unique), (SAME, show_same))
+            if shown
+        }
+        self._options = {'workers': workers, 'use_mmap': use_mmap, 'pep508': pep508}
+        self._store = snapshot if isinstance(snapshot, SnapshotStore) else SnapshotStore(snapshot)
+        self._signatures = None
+        self._changed_at = None
+
+    def _signature(self):
+        signatures = {}
+        for filepath in self._store.filepaths():
+            try:
+                stat = os.stat(filepath)
+                signatures[filepath] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                signatures[filepath] = None
+        return signatures
+
+    def _compare(self, full=False):
+        """
+        Run the comparison against the snapshot, printing the full table the
+        first time and only the changed records afterwards.
+        """
+        try:
+            results = _compare_reqs(*self.directories, snapshot=self._store, **self._options)
+        except Exception as e:
+            # keep watching, the file may be mid save or about to be restored
+            print(e, file=self.stream)
+            return
+
+        if full or self._store.changes is None:
+            _print_table(*results, self.show_diff_versions, self.show_unique, self.show_same,
+                         self.remove_spaces, stream=self.stream)
+        else:
+            _print_changes(*self._store.changes, self.categories, self.remove_spaces, stream=self.stream)
+        (self.stream or sys.stdout).flush()
+
+    def check(self):
+        """
+        Poll the watched files once, comparing again if they changed and have
+        settled for the debounce period.
+
+        # return: (bool) True if the comparison was run
+        """
+        if self._signatures is None:
+            self._compare(full=True)
+            self._signatures = self._signature()
+            return True
+
+        signatures = self._signature()
+        now = self.clock()
+        if signatures != self._signatures:
+            # rapid saves keep pushing the comparison back
+            self._signatures = signatures
+            self._changed_at = now
+            return False
+        if self._changed_at is None or now - self._changed_at < self.debounce:
+            return False
+
+        self._changed_at = None
+        self._compare()
+        # includes may have been added or removed
+        self._signatures = self._signature()
+        return True
+
+    def run(self):
+        """
+        Watch until interrupted.
+        """
+        while True:
+            self.check()
+            time.sleep(self.interval)
+
+
+def _expand_sources(arguments):
+    """
+    Expand command line sources into the directories, files and URLs to
+    compare.  Glob patterns are expanded (``**`` included) and ``@listfile``
+    arguments are replaced by the sources listed in the file, one per line.
+
+    # param arguments: (list) command line sources
+    # return: (list) sources in argument order without duplicates
+    """
+    sources = []
+    for argument in arguments:
+        if argument.startswith('@'):
+            with open(argument[1:], 'r') as f:
+                listed = [line.strip() for line in f]
+            sources.extend(_expand_sources([line for line in listed if line and not line.startswith('#')]))
+        elif not _is_url(argument) and glob.has_magic(argument):
+            matches = sorted(glob.glob(argument, recursive=True))
+            if not matches:
+                raise ValueError(f"No requirements files match {argument}")
+            sources.extend(matches)
+        else:
+            sources.append(argument)
+
+    return list(dict.fromkeys(sources))
+
+
+def _name_regex(pattern):
+    """
+    Compile a --name-regex pattern, case insensitive like --name globs.
+    """
+    import argparse
+
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f"invalid regular expression {pattern!r}: {e}")
+
+
+def _build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='compare-reqs', description='Compare two or more requirements files.')
+    parser.add_argument('sources', nargs='+',
+                        help='directories, requirements files, URLs, glob patterns, @listfile, installed: for '
+                             'this interpreter, venv:PATH for another environment or - for stdin')
+    parser.add_argument('--no-diff', dest='show_diff_versions', action='store_false',
+                        help='hide packages with different versions')
+    parser.add_argument('--same', dest='show_same', action='store_true',
+                        help='show packages with the same versions')
+    parser.add_argument('--unique', dest='show_unique', action='store_true',
+                        help='show packages unique to a single file')
+    parser.add_argument('--remove-spaces', action='store_true',
+                        help='remove spaces from package versions')
+    parser.add_argument('--format', dest='output_format', default=OUTPUT_TABLE,
+                        choices=[OUTPUT_TABLE] + sorted(OUTPUT_WRITERS), help='output format')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    parser.add_argument('--name', dest='names', action='append',
+                        help='only show packages matching this glob, may be repeated')
+    parser.add_argument('--name-regex', dest='name_regexes', action='append', type=_name_regex,
+                        help='only show packages matching this regular expression, may be repeated')
+    parser.add_argument('--only', dest='only_sources', action='append',
+                        help='only show results for this source, may be repeated')
+    parser.add_argument('--limit', type=int, help='most rows per table section, or records for other formats')
+    parser.add_argument('--workers', type=int, help='number of workers to fetch and parse with')
+    parser.add_argument('--processes', dest='use_processes', action='store_true',
+                        help='parse in worker processes instead of threads')
+    parser.add_argument('--snapshot', help='snapshot file making repeated comparisons incremental')
+    parser.add_argument('--mmap', dest='use_mmap', action='store_true',
+                        help='read files through memory mappings, for very large frozen requirements')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running, printing changes whenever a local source file changes')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between polls in --watch mode')
+    parser.add_argument('--matrix', action='store_true',
+                        help='count shared, same, different and unique packages between every pair of sources')
+    parser.add_argument('--jaccard', action='store_true', help='add jaccard similarity to --matrix output')
+    parser.add_argument('--conflicts', action='store_true',
+                        help='report packages whose versions cannot be satisfied together, exit 1 if any')
+    parser.add_argument('--pep508', action='store_true',
+                        help='parse extras, markers and multi clause specifiers as described in PEP 508')
+    parser.add_argument('--stats', action='store_true', help='print stage timings and counters to stderr')
+    parser.add_argument('--profile', help='write a cProfile capture of the comparison to this file')
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+    return parser
+
+
+def main(argv=None):
+    """
+    Command line entry point.  All sources are compared in a single run.
+
+    # param argv: (list) command line arguments, sys.argv if not set
+    # return: (int) exit status
+    """
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        sources = _expand_sources(args.sources)
+        stream = open(args.output, 'w') if args.output else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.watch:
+        try:
+            watcher = Watcher(
+                *sources,
+                show_diff_versions=args.show_diff_versions,
+                show_same=args.show_same,
+                show_unique=args.show_unique,
+                remove_spaces=args.remove_spaces,
+                interval=args.interval,
+                workers=args.workers,
+                use_mmap=args.use_mmap,
+                pep508=args.pep508,
+                snapshot=args.snapshot,
+                stream=stream,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            return 0
+        finally:
+            if stream is not None:
+                stream.close()
+
+    names = None
+    if args.names or args.name_regexes:
+        names = (args.names or []) + (args.name_regexes or [])
+
+    stats = Stats() if args.stats else None
+    try:
+        if args.matrix:
+            succeeded = drift_matrix(
+                *sources,
+                jaccard=args.jaccard,
+                output_format=args.output_format,
+                stream=stream,
+                workers=args.workers,
+                use_processes=args.use_processes,
+                use_mmap=args.use_mmap,
+                pep508=args.pep508,
+                stats=stats,
+                profile=args.profile,
+            )
+        elif args.conflicts:
+            succeeded = check_compatibility(
+                *sources,
+                remove_spaces=args.remove_spaces,
+                workers=args.workers,
+                use_processes=args.use_processes,
+                use_mmap=args.use_mmap,
+                pep508=args.pep508,
+                stream=stream,
+                stats=stats,
+                profile=args.profile,
+            )
+        else:
+            succeeded = compare_reqs(
+                *sources,
+                show_diff_versions=args.show_diff_versions,
+                show_same=args.show_same,
+                show_unique=args.show_unique,
+                remove_spaces=args.remove_spaces,
+                workers=args.workers,
+                use_processes=args.use_processes,
+                snapshot=args.snapshot,
+                use_mmap=args.use_mmap,
+                pep508=args.pep508,
+                output_format=args.output_format,
+                stream=stream,
+                stats=stats,
+                profile=args.profile,
+                names=names,
+                sources=args.only_sources,
+                limit=args.limit,
+            )
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        if stream is not None:
+            stream.close()
+
+    if stats is not None:
+        print(stats, file=sys.stderr)
+    return 0 if succeeded else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
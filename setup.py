@@ -1,4 +1,4 @@
-from setuptools import setup, find_packages
+from setuptools import setup
 
 install_requires = [
     'pip',
@@ -10,8 +10,14 @@ install_requires = [
 setup(
     name='python-compare-requirements',
     version='0.1.0',
-    packages=find_packages(),
+    py_modules=['compare_reqs'],
+    python_requires='>=3.8',
     install_requires=install_requires,
+    entry_points={
+        'console_scripts': [
+            'compare-reqs=compare_reqs:main',
+        ],
+    },
     author='Mark Hess',
     description='A tool for comparing 2 or more requirements files',
     keywords='python requirements comparison tool'
@@ -1,6 +1,28 @@
+import asyncio
+import contextlib
+import csv
+import hashlib
+import io
+import json
 import os
+import pickle
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
-from compare_reqs import _establish_filepath, parse_requirements, _compare_reqs
+import urllib.parse
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from compare_reqs import (
+    _establish_filepath, parse_requirements, iter_requirements, _compare_reqs, _classify_packages, _load_packages,
+    _Fetcher, Package, SnapshotStore, Stats, canonical_name, compare_reqs, main, resolve_requirements,
+    _find_conflicts, check_compatibility, _drift_matrix, drift_matrix, Watcher, _compare_reqs_async,
+    compare_reqs_async, CompactResult, _load_packages_async, _classify_entries,
+)
 
 
 class TestEstablishFilepath(unittest.TestCase):
@@ -23,12 +45,202 @@ class TestEstablishFilepath(unittest.TestCase):
         with self.assertRaises(ValueError):
             _establish_filepath('not_here_requirements.txt')
 
+
+class _RequirementsHandler(BaseHTTPRequestHandler):
+    """
+    Serves requirements files with ETag validation over kept-alive connections.
+    """
+    protocol_version = 'HTTP/1.1'
+    files = {}
+    requests = []
+    delays = {}
+
+    def do_GET(self):
+        time.sleep(self.delays.get(self.path, 0))
+        body = self.files.get(self.path)
+        if body is None:
+            self._respond(404)
+            return
+
+        etag = '"' + hashlib.sha256(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self._respond(304)
+        else:
+            self._respond(200, body, etag)
+
+    def _respond(self, status, body=b'', etag=None):
+        self.requests.append((self.path, status, self.client_address))
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            # clients that timed out have closed the connection
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class _ProxyHandler(_RequirementsHandler):
+    """
+    Serves the same files as a forward proxy, requested by absolute URL.
+    """
+
+    def do_GET(self):
+        self.path = urllib.parse.urlsplit(self.path).path
+        super().do_GET()
+
+
+class TestFetcher(unittest.TestCase):
+
+    def setUp(self):
+        _RequirementsHandler.files = {
+            '/a/requirements.txt': b'requests==2.22.0\n',
+            '/b/requirements.txt': b'requests==2.28.0\n',
+        }
+        _RequirementsHandler.requests = []
+        _RequirementsHandler.delays = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _RequirementsHandler)
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.cache_dir = tempfile.mkdtemp()
+        self.fetcher = _Fetcher(cache_dir=self.cache_dir)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
     def test_http_url(self):
-        filepath = _establish_filepath(
-            'https://github.com/numpy/numpy/blob/main/build_requirements.txt'
-        )
-        self.assertEqual(filepath, 'build_requirements.txt')
-        os.remove(filepath)
+        filepath = _establish_filepath(f'{self.base_url}/a/requirements.txt', fetcher=self.fetcher)
+        self.assertTrue(filepath.startswith(self.cache_dir))
+        self.assertEqual(parse_requirements(filepath), (Package('requests', '2.22.0', '=='),))
+
+    def test_revalidates_cached_file(self):
+        url = f'{self.base_url}/a/requirements.txt'
+        first = self.fetcher.fetch(url)
+        second = _Fetcher(cache_dir=self.cache_dir).fetch(url)
+        self.assertEqual(first, second)
+        self.assertEqual([status for _, status, _ in _RequirementsHandler.requests], [200, 304])
+
+    def test_same_basename_does_not_clobber(self):
+        first = self.fetcher.fetch(f'{self.base_url}/a/requirements.txt')
+        second = self.fetcher.fetch(f'{self.base_url}/b/requirements.txt')
+        self.assertNotEqual(first, second)
+        self.assertEqual(parse_requirements(first), (Package('requests', '2.22.0', '=='),))
+        self.assertEqual(parse_requirements(second), (Package('requests', '2.28.0', '=='),))
+
+    def test_reuses_connection(self):
+        self.fetcher.fetch(f'{self.base_url}/a/requirements.txt')
+        self.fetcher.fetch(f'{self.base_url}/b/requirements.txt')
+        self.fetcher.fetch(f'{self.base_url}/a/requirements.txt')
+        client_addresses = {address for _, _, address in _RequirementsHandler.requests}
+        self.assertEqual(len(_RequirementsHandler.requests), 3)
+        self.assertEqual(len(client_addresses), 1)
+
+    def test_refetches_evicted_file_on_not_modified(self):
+        url = f'{self.base_url}/a/requirements.txt'
+        first = self.fetcher.fetch(url)
+        request = self.fetcher._request
+
+        def evicting_request(*args, **kwargs):
+            # the cached copy is evicted while the request is in flight
+            if os.path.exists(first):
+                os.remove(first)
+            return request(*args, **kwargs)
+
+        with mock.patch.object(self.fetcher, '_request', side_effect=evicting_request):
+            second = self.fetcher.fetch(url)
+        self.assertEqual(first, second)
+        self.assertTrue(os.path.exists(second))
+        self.assertEqual([status for _, status, _ in _RequirementsHandler.requests], [200, 304, 200])
+
+    def test_honours_proxy_environment(self):
+        proxy = ThreadingHTTPServer(('127.0.0.1', 0), _ProxyHandler)
+        threading.Thread(target=proxy.serve_forever, args=(0.05,), daemon=True).start()
+        proxy_url = f'http://127.0.0.1:{proxy.server_address[1]}'
+        try:
+            with mock.patch.dict(os.environ, {'http_proxy': proxy_url, 'no_proxy': ''}):
+                filepath = self.fetcher.fetch('http://requirements.invalid/a/requirements.txt')
+            self.assertEqual(parse_requirements(filepath), (Package('requests', '2.22.0', '=='),))
+
+            # hosts listed in no_proxy are still fetched directly
+            with mock.patch.dict(os.environ, {'http_proxy': 'http://127.0.0.1:9', 'no_proxy': '127.0.0.1'}):
+                filepath = self.fetcher.fetch(f'{self.base_url}/b/requirements.txt')
+            self.assertEqual(parse_requirements(filepath), (Package('requests', '2.28.0', '=='),))
+        finally:
+            proxy.shutdown()
+            proxy.server_close()
+
+    def test_missing_url(self):
+        with self.assertRaises(ValueError):
+            self.fetcher.fetch(f'{self.base_url}/missing/requirements.txt')
+
+    def test_evicts_least_recently_used(self):
+        fetcher = _Fetcher(cache_dir=self.cache_dir, max_cache_size=20)
+        first = fetcher.fetch(f'{self.base_url}/a/requirements.txt')
+        os.utime(first, (0, 0))
+        second = fetcher.fetch(f'{self.base_url}/b/requirements.txt')
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+    def test_compare_urls_reported_by_url(self):
+        urls = [f'{self.base_url}/a/requirements.txt', f'{self.base_url}/b/requirements.txt']
+        with mock.patch('compare_reqs._default_fetcher', self.fetcher):
+            packages = _load_packages(urls)
+        self.assertEqual(list(packages), urls)
+
+    def test_async_mixed_sources(self):
+        urls = [f'{self.base_url}/a/requirements.txt', f'{self.base_url}/b/requirements.txt']
+        with tempfile.NamedTemporaryFile('w', suffix='requirements.txt', delete=False) as f:
+            f.write('requests==2.22.0\n')
+        try:
+            with mock.patch('compare_reqs._default_fetcher', self.fetcher):
+                results = asyncio.run(_compare_reqs_async(*urls, f.name, host_connections=1))
+                self.assertEqual(results, _compare_reqs(*urls, f.name))
+        finally:
+            os.remove(f.name)
+        self.assertEqual(results[0][Package('requests', '2.22.0', '==')], [urls[0], f.name])
+
+    def test_async_timeout_stops_download(self):
+        _RequirementsHandler.delays['/slow/requirements.txt'] = 1.0
+        _RequirementsHandler.files['/slow/requirements.txt'] = b'six\n'
+        urls = [f'{self.base_url}/slow/requirements.txt', f'{self.base_url}/a/requirements.txt']
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def establish(directory, timeout=None):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            try:
+                return _establish_filepath(directory, fetcher=self.fetcher, timeout=timeout)
+            finally:
+                with lock:
+                    state['active'] -= 1
+
+        start = time.perf_counter()
+        with mock.patch('compare_reqs._establish_filepath', side_effect=establish):
+            with self.assertRaisesRegex(ValueError, 'Timed out'):
+                asyncio.run(_load_packages_async(urls, host_connections=1, timeout=0.2))
+        # the download itself gave up rather than waiting for the server
+        self.assertLess(time.perf_counter() - start, 0.9)
+        self.assertEqual(state['peak'], 1)
+
+    def test_relative_include_of_url(self):
+        _RequirementsHandler.files['/c/requirements.txt'] = b'-r ../base.txt\nsix\n'
+        _RequirementsHandler.files['/base.txt'] = b'requests==2.22.0\n'
+        url = f'{self.base_url}/c/requirements.txt'
+        with mock.patch('compare_reqs._default_fetcher', self.fetcher):
+            packages = _load_packages([url, f'{self.base_url}/a/requirements.txt'])
+        self.assertEqual(packages[url], (Package('six'), Package('requests', '2.22.0', '==')))
 
 
 class TestParseRequirements(unittest.TestCase):
@@ -61,6 +273,112 @@ class TestParseRequirements(unittest.TestCase):
         self.assertEqual(parsed_reqs[3].version_spec, '==')
         self.assertEqual(parsed_reqs[3].version, '2.22.0')
 
+    def test_iter_requirements(self):
+        tmp_file = 'tmp_requirements.txt'
+        with open(tmp_file, 'w') as f:
+            f.write('# comment' + '\n')
+            f.write('\n')
+            f.write('-r base.txt' + '\n')
+            f.write('requests == 2.22.0  # pinned' + '\n')
+            f.write('numpy>=1.19.2,<2.0' + '\n')
+            f.write('pandas' + '\n')
+            f.write('pandas' + '\n')
+
+        packages = iter_requirements(tmp_file)
+        self.assertEqual(next(packages), Package('requests', '2.22.0', '=='))
+        remaining = list(packages)
+        os.remove(tmp_file)
+
+        self.assertEqual(remaining, [
+            Package('numpy', '1.19.2,<2.0', '>='),
+            Package('pandas'),
+            Package('pandas'),
+        ])
+
+    def test_mmap_reader_matches_line_reader(self):
+        tmp_file = 'tmp_requirements.txt'
+        with open(tmp_file, 'w') as f:
+            f.write('# comment' + '\n')
+            f.write('--index-url https://example.com/simple' + '\n')
+            f.write('\n')
+            f.write('requests==2.22.0' + '\n')
+            f.write('numpy>1.19.2  # pinned' + '\n')
+            f.write('pandas')
+
+        mapped = list(iter_requirements(tmp_file, use_mmap=True))
+        with mock.patch('compare_reqs.MMAP_WINDOW', 8):
+            windowed = list(iter_requirements(tmp_file, use_mmap=True))
+        read = list(iter_requirements(tmp_file))
+        os.remove(tmp_file)
+
+        self.assertEqual(mapped, read)
+        self.assertEqual(windowed, read)
+        self.assertEqual(len(mapped), 3)
+
+    def test_mmap_reader_first_line(self):
+        tmp_file = 'tmp_requirements.txt'
+        with open(tmp_file, 'w') as f:
+            f.write('requests==2.22.0' + '\n')
+            f.write('pandas' + '\n')
+        packages = parse_requirements(tmp_file, use_mmap=True)
+        os.remove(tmp_file)
+        self.assertEqual(packages, (Package('requests', '2.22.0', '=='), Package('pandas')))
+
+    def test_mmap_reader_empty_file(self):
+        tmp_file = 'tmp_requirements.txt'
+        open(tmp_file, 'w').close()
+        self.assertEqual(parse_requirements(tmp_file, use_mmap=True), ())
+        os.remove(tmp_file)
+
+    # pip-compile --generate-hashes output
+    HASHED_LINES = [
+        '# via -r requirements.in',
+        'requests==2.22.0 \\',
+        '    --hash=sha256:aaa \\',
+        '    --hash=sha256:bbb',
+        'six==1.16.0 --hash=sha256:ccc',
+        'numpy==1.19.2 \\',
+        '    --hash=sha256:ddd',
+        '    # via pandas',
+    ]
+
+    def test_generate_hashes(self):
+        tmp_file = 'tmp_requirements.txt'
+        with open(tmp_file, 'w') as f:
+            f.write('\n'.join(self.HASHED_LINES) + '\n')
+
+        expected = (
+            Package('requests', '2.22.0', '=='), Package('six', '1.16.0', '=='), Package('numpy', '1.19.2', '=='),
+        )
+        for use_mmap in (False, True):
+            self.assertEqual(parse_requirements(tmp_file, use_mmap=use_mmap), expected)
+            self.assertEqual(parse_requirements(tmp_file, use_mmap=use_mmap, pep508=True), expected)
+        os.remove(tmp_file)
+
+    def test_pep508(self):
+        tmp_file = 'tmp_requirements.txt'
+        with open(tmp_file, 'w') as f:
+            f.write('requests[socks,Security]>=2.0,<3.0 ; python_version >= "3.8"  # pinned below 3' + '\n')
+            f.write('numpy==1.19.2 --hash=sha256:abc' + '\n')
+            f.write('pkg @ https://example.com/pkg-1.0.whl' + '\n')
+            f.write('pandas' + '\n')
+
+        for use_mmap in (False, True):
+            requests, numpy, pkg, pandas = parse_requirements(tmp_file, use_mmap=use_mmap, pep508=True)
+            self.assertEqual(requests, Package(
+                'requests', None, '<3.0,>=2.0', ('security', 'socks'), 'python_version >= "3.8"'
+            ))
+            self.assertTrue(requests.specifier.contains('2.28.0'))
+            self.assertFalse(requests.specifier.contains('3.0'))
+            self.assertEqual(str(requests), 'requests[security,socks] <3.0,>=2.0; python_version >= "3.8"')
+            self.assertEqual(numpy, Package('numpy', '1.19.2', '=='))
+            self.assertEqual(pkg, Package('pkg', 'https://example.com/pkg-1.0.whl', '@'))
+            self.assertEqual(pandas, Package('pandas'))
+
+        # identical lines are parsed once and share a package
+        self.assertIs(parse_requirements(tmp_file, pep508=True)[0], requests)
+        os.remove(tmp_file)
+
 
 class TestCompareReqs(unittest.TestCase):
 
@@ -244,3 +562,983 @@ class TestCompareReqs(unittest.TestCase):
         self.assertEqual(same_packages[2][1], ['tmp_requirements2.txt', 'tmp_requirements3.txt'])
         self.assertEqual(same_packages[3][0].name, 'scipy')
         self.assertEqual(same_packages[3][1], ['tmp_requirements1.txt', 'tmp_requirements2.txt'])
+
+
+class TestResolveRequirements(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name, lines):
+        filepath = os.path.join(self.tmp_dir, name)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return filepath
+
+    def test_layered_includes(self):
+        self._write('base.txt', ['requests==2.22.0', 'six'])
+        self._write('constraints.txt', ['six==1.16.0', 'numpy==1.19.2'])
+        service = self._write('service/requirements.txt', [
+            '-r ../base.txt', '--constraint=../constraints.txt', 'flask>=2.0  # web',
+        ])
+        self.assertEqual(resolve_requirements(service), (
+            Package('flask', '2.0', '>='), Package('requests', '2.22.0', '=='), Package('six', '1.16.0', '=='),
+        ))
+        self.assertEqual(parse_requirements(service), (Package('flask', '2.0', '>='),))
+
+    def test_include_forms(self):
+        for idx, option in enumerate(['-r', '-r ', '--requirement ', '--requirement=', '  -r\t']):
+            self._write(f'base{idx}.txt', [f'pkg{idx}'])
+            service = self._write(f'service{idx}.txt', [f'{option}base{idx}.txt'])
+            self.assertEqual(resolve_requirements(service), (Package(f'pkg{idx}'),))
+            self.assertEqual(resolve_requirements(service, use_mmap=True), (Package(f'pkg{idx}'),))
+
+    def test_cycle(self):
+        self._write('a.txt', ['-r b.txt', 'six'])
+        self._write('b.txt', ['-r c.txt'])
+        self._write('c.txt', ['-r a.txt'])
+        with self.assertRaisesRegex(ValueError, 'cycle'):
+            resolve_requirements(os.path.join(self.tmp_dir, 'a.txt'))
+
+    def test_missing_include(self):
+        service = self._write('requirements.txt', ['-r missing.txt'])
+        with self.assertRaises(ValueError):
+            resolve_requirements(service)
+
+    def test_shared_include_parsed_once(self):
+        base = self._write('base.txt', ['requests==2.22.0', '-c constraints.txt'])
+        self._write('constraints.txt', ['six==1.16.0'])
+        services = [self._write(f'service{idx}/requirements.txt', ['-r ../base.txt', 'six']) for idx in range(4)]
+
+        for workers in (None, 4):
+            with mock.patch('compare_reqs.parse_requirements', wraps=parse_requirements) as parse:
+                packages = _load_packages(services, workers=workers)
+            parsed = [call[0][0] for call in parse.call_args_list]
+            self.assertEqual(parsed.count(base), 1)
+            self.assertEqual(len(parsed), 6)
+            self.assertEqual(packages[services[0]],
+                             (Package('six', '1.16.0', '=='), Package('requests', '2.22.0', '==')))
+
+    def test_snapshot_sees_changed_include(self):
+        base = self._write('base.txt', ['requests==2.22.0'])
+        services = [self._write(f'service{idx}/requirements.txt', ['-r ../base.txt']) for idx in range(2)]
+        services.append(self._write('other/requirements.txt', ['requests==2.28.0']))
+        store = SnapshotStore()
+        _compare_reqs(*services, snapshot=store)
+
+        with open(base, 'w') as f:
+            f.write('requests==2.28.0\n')
+        os.utime(base, ns=(10 ** 9, 10 ** 9))
+        self.assertEqual(_compare_reqs(*services, snapshot=store), _compare_reqs(*services))
+        self.assertEqual(dict(_compare_reqs(*services, snapshot=store)[0]), {})
+
+
+class TestClassifyPackages(unittest.TestCase):
+
+    def test_classify_by_name_index(self):
+        packages = {
+            'a.txt': (Package('numpy', '1.19.2', '=='), Package('requests', '2.22.0', '=='), Package('six')),
+            'b.txt': (Package('numpy', '1.19.2', '=='), Package('requests', '2.22.0', '==')),
+            'c.txt': (Package('numpy', '1.22.2', '>='), Package('pytest', '7.0.0', '==')),
+        }
+        diff_packages, unique_packages, same_packages = _classify_packages(packages)
+
+        self.assertEqual(diff_packages[Package('numpy', '1.19.2', '==')], ['a.txt', 'b.txt'])
+        self.assertEqual(diff_packages[Package('numpy', '1.22.2', '>=')], ['c.txt'])
+        self.assertEqual(unique_packages[Package('six')], ['a.txt'])
+        self.assertEqual(unique_packages[Package('pytest', '7.0.0', '==')], ['c.txt'])
+        self.assertEqual(same_packages[Package('requests', '2.22.0', '==')], ['a.txt', 'b.txt'])
+        self.assertEqual(len(diff_packages), 2)
+        self.assertEqual(len(unique_packages), 2)
+        self.assertEqual(len(same_packages), 1)
+
+    def test_names_match_after_normalization(self):
+        packages = {
+            'a.txt': (Package('Django', '4.0', '=='), Package('zope_interface', '5.4.0', '=='),
+                      Package('Flask', '2.0.0', '==')),
+            'b.txt': (Package('django', '4.0', '=='), Package('zope.interface', '5.4.0', '=='),
+                      Package('flask', '2.2.0', '==')),
+        }
+        diff_packages, unique_packages, same_packages = _classify_packages(packages)
+
+        self.assertEqual(len(unique_packages), 0)
+        self.assertEqual(same_packages[Package('Django', '4.0', '==')], ['a.txt'])
+        self.assertEqual(same_packages[Package('django', '4.0', '==')], ['b.txt'])
+        self.assertEqual(same_packages[Package('zope.interface', '5.4.0', '==')], ['b.txt'])
+        self.assertEqual(diff_packages[Package('Flask', '2.0.0', '==')], ['a.txt'])
+        self.assertEqual(diff_packages[Package('flask', '2.2.0', '==')], ['b.txt'])
+
+    def test_pep508_specifier_sets(self):
+        files = ['tmp_requirements1.txt', 'tmp_requirements2.txt']
+        for filepath, lines in zip(files, [
+            ['Django>=3.0,<4.0', 'requests[socks]==2.22.0', 'six; python_version < "3"'],
+            ['django < 4.0, >= 3.0', 'requests==2.22.0', 'six; python_version >= "3"'],
+        ]):
+            with open(filepath, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+        diff_packages, unique_packages, same_packages = _compare_reqs(*files, pep508=True)
+        for filepath in files:
+            os.remove(filepath)
+
+        self.assertEqual([package.canonical_name for package in same_packages], ['django', 'django'])
+        self.assertEqual(sorted({package.canonical_name for package in diff_packages}), ['requests', 'six'])
+        self.assertEqual(len(unique_packages), 0)
+
+
+class TestCompatibility(unittest.TestCase):
+
+    def _conflicting(self, *specifiers):
+        packages = {f'{idx}.txt': (Package('numpy', None, specifier),) for idx, specifier in enumerate(specifiers)}
+        return 'numpy' in _find_conflicts(packages)
+
+    def test_compatible_ranges(self):
+        self.assertFalse(self._conflicting('>=1.19', '==1.22.2'))
+        self.assertFalse(self._conflicting('>=1.19,<2.0', '~=1.22', '!=1.22.0'))
+        self.assertFalse(self._conflicting('==1.22.*', '>1.22.1'))
+        self.assertFalse(self._conflicting('<=1.22', '>=1.22'))
+
+    def test_conflicting_ranges(self):
+        self.assertTrue(self._conflicting('>=1.22', '<1.20'))
+        self.assertTrue(self._conflicting('==1.22.2', '!=1.22.2'))
+        self.assertTrue(self._conflicting('~=1.22.0', '>=1.23'))
+        self.assertTrue(self._conflicting('==1.22.*', '==1.23.0'))
+        self.assertTrue(self._conflicting('<1.22', '>1.22'))
+        self.assertTrue(self._conflicting('<1.22,>1.23'))
+
+    def test_markers_and_unversioned(self):
+        packages = {
+            'a.txt': (Package('six', None, '<1.0', marker='python_version < "3"'), Package('requests')),
+            'b.txt': (Package('six', None, '>=1.16', marker='python_version >= "3"'), Package('requests', '2.0', '==')),
+            'c.txt': (Package('pytest', 'https://example.com/pytest.whl', '@'), Package('pytest', '7.0', '==')),
+        }
+        self.assertEqual(_find_conflicts(packages), {})
+
+    def test_check_compatibility(self):
+        files = ['tmp_requirements1.txt', 'tmp_requirements2.txt']
+        for filepath, lines in zip(files, [['numpy>=1.19', 'six<1.0'], ['numpy==1.22.2', 'six>=1.16']]):
+            with open(filepath, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+        stream = io.StringIO()
+        compatible = check_compatibility(*files, stream=stream, pep508=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            status = main(['--conflicts', *files])
+        for filepath in files:
+            os.remove(filepath)
+
+        self.assertFalse(compatible)
+        self.assertEqual(status, 1)
+        self.assertIn('six < 1.0                      - tmp_requirements1.txt', stream.getvalue())
+        self.assertNotIn('numpy', stream.getvalue())
+
+
+class TestDriftMatrix(unittest.TestCase):
+
+    def test_counts(self):
+        packages = {
+            'a.txt': (Package('requests', '2.22.0', '=='), Package('numpy', '1.19.2', '=='), Package('six')),
+            'b.txt': (Package('Requests', '2.22.0', '=='), Package('numpy', '1.22.0', '==')),
+            'c.txt': (),
+        }
+        matrix = _drift_matrix(packages, jaccard=True)
+
+        self.assertEqual(matrix['sources'], ['a.txt', 'b.txt', 'c.txt'])
+        self.assertEqual(matrix['shared'], [[3, 2, 0], [2, 2, 0], [0, 0, 0]])
+        self.assertEqual(matrix['same'], [[3, 1, 0], [1, 2, 0], [0, 0, 0]])
+        self.assertEqual(matrix['different'], [[0, 1, 0], [1, 0, 0], [0, 0, 0]])
+        self.assertEqual(matrix['unique'], [[0, 1, 3], [0, 0, 2], [0, 0, 0]])
+        self.assertEqual(matrix['jaccard'][0], [1.0, 0.25, 0.0])
+        self.assertEqual(matrix['jaccard'][2][2], 1.0)
+        self.assertNotIn('jaccard', _drift_matrix(packages))
+
+    def test_matches_pairwise_comparisons(self):
+        packages = {
+            f'{idx}.txt': tuple(Package(f'pkg{(idx + offset) % 7}', f'1.{offset % 2}', '==') for offset in range(4))
+            for idx in range(5)
+        }
+        matrix = _drift_matrix(packages)
+        for i, left in enumerate(packages):
+            for j, right in enumerate(packages):
+                if i == j:
+                    continue
+                diff_packages, unique_packages, same_packages = _classify_packages(
+                    {left: packages[left], right: packages[right]}
+                )
+                self.assertEqual(matrix['different'][i][j], len({p.canonical_name for p in diff_packages}))
+                self.assertEqual(matrix['same'][i][j], len(same_packages))
+                self.assertEqual(matrix['unique'][i][j], sum(files == [left] for files in unique_packages.values()))
+
+    def test_export(self):
+        files = ['tmp_requirements1.txt', 'tmp_requirements2.txt']
+        for filepath, lines in zip(files, [['requests==2.22.0', 'six'], ['requests==2.28.0']]):
+            with open(filepath, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+        outputs = {}
+        for output_format in ('json', 'csv', 'table'):
+            stream = io.StringIO()
+            self.assertTrue(drift_matrix(*files, jaccard=True, output_format=output_format, stream=stream))
+            outputs[output_format] = stream.getvalue()
+        for filepath in files:
+            os.remove(filepath)
+
+        self.assertEqual(json.loads(outputs['json'])['different'], [[0, 1], [1, 0]])
+        self.assertEqual(list(csv.DictReader(io.StringIO(outputs['csv']))), [{
+            'left': files[0], 'right': files[1], 'shared': '1', 'same': '0', 'different': '1',
+            'unique_left': '1', 'unique_right': '0', 'jaccard': '0.0',
+        }])
+        self.assertIn(f'{files[0]} <-> {files[1]}: shared 1 same 0 different 1 unique 1/0', outputs['table'])
+
+
+class TestCompactResult(unittest.TestCase):
+
+    def setUp(self):
+        self.packages = {
+            'a.txt': (Package('requests', '2.22.0', '=='), Package('numpy', '1.19.2', '=='), Package('six')),
+            'b.txt': (Package('requests', '2.22.0', '=='), Package('numpy', '1.22.2', '>='),
+                      Package('pytest', None, '<8,>=7', ('testing',), 'python_version >= "3.8"')),
+        }
+        self.results = _classify_packages(self.packages)
+
+    def test_views_match_results(self):
+        compact = CompactResult.from_results(*self.results)
+        self.assertEqual(tuple(compact), self.results)
+        self.assertEqual(compact.unique_packages, self.results[1])
+        self.assertEqual(len(compact), 6)
+        self.assertEqual(compact.sources, ['a.txt', 'b.txt'])
+        self.assertEqual(list(compact.records())[0], ('diff', Package('numpy', '1.19.2', '=='), 'a.txt'))
+
+    def test_pickle(self):
+        compact = pickle.loads(pickle.dumps(CompactResult.from_results(*self.results)))
+        self.assertEqual(tuple(compact), self.results)
+        compact.add('unique', Package('flask'), 'c.txt')
+        self.assertEqual(compact.unique_packages[Package('flask')], ['c.txt'])
+
+    def test_columns_widen(self):
+        compact = CompactResult()
+        for idx in range(300):
+            compact.add('unique', Package(f'pkg{idx}', '1.0', '=='), f'{idx}.txt')
+        self.assertEqual(compact.record_sources.typecode, 'H')
+        self.assertEqual(compact.names.typecode, 'H')
+        self.assertEqual(compact.versions.typecode, 'B')
+        self.assertEqual(list(compact.records())[299], ('unique', Package('pkg299', '1.0', '=='), '299.txt'))
+
+    def test_compare_reqs_compact(self):
+        files = ['tmp_requirements1.txt', 'tmp_requirements2.txt']
+        for filepath, lines in zip(files, [['requests==2.22.0', 'six'], ['requests==2.28.0', 'six']]):
+            with open(filepath, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+        try:
+            compact = _compare_reqs(*files, compact=True)
+            self.assertIsInstance(compact, CompactResult)
+            self.assertEqual(tuple(compact), _compare_reqs(*files))
+            self.assertEqual(tuple(_compare_reqs(*files, compact=True, snapshot=SnapshotStore())), tuple(compact))
+        finally:
+            for filepath in files:
+                os.remove(filepath)
+
+
+class TestSourceAdapters(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.site_packages = os.path.join(self.tmp_dir, 'venv', 'lib', 'python3.11', 'site-packages')
+        os.makedirs(self.site_packages)
+        self._dist_info('requests-2.22.0.dist-info', 'METADATA', 'requests', '2.22.0')
+        self._dist_info('Six-1.16.0.dist-info', 'METADATA', 'Six', '1.16.0')
+        self._dist_info('legacy-1.0-py3.11.egg-info', 'PKG-INFO', 'legacy', '1.0')
+        os.makedirs(os.path.join(self.site_packages, 'requests'))
+        self.requirements = os.path.join(self.tmp_dir, 'requirements.txt')
+        with open(self.requirements, 'w') as f:
+            f.write('requests==2.28.0\nsix==1.16.0\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _dist_info(self, directory, filename, name, version):
+        os.makedirs(os.path.join(self.site_packages, directory))
+        with open(os.path.join(self.site_packages, directory, filename), 'w') as f:
+            f.write(f'Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n\nName: not-a-header\n')
+
+    def test_venv(self):
+        venv = 'venv:' + os.path.join(self.tmp_dir, 'venv')
+        packages = _load_packages([venv, self.requirements])
+        self.assertEqual(packages[venv], (
+            Package('legacy', '1.0', '=='), Package('requests', '2.22.0', '=='), Package('Six', '1.16.0', '=='),
+        ))
+
+        diff_packages, unique_packages, same_packages = _compare_reqs(venv, self.requirements, workers=2)
+        self.assertEqual(diff_packages[Package('requests', '2.22.0', '==')], [venv])
+        self.assertEqual(unique_packages[Package('legacy', '1.0', '==')], [venv])
+        self.assertEqual(len(same_packages), 2)
+
+        with self.assertRaises(ValueError):
+            _load_packages(['venv:' + self.tmp_dir, self.requirements])
+
+    def test_installed(self):
+        from importlib import metadata
+
+        packages = _load_packages(['installed:'])['installed:']
+        self.assertIn(Package(metadata.distribution('packaging').metadata['Name'], metadata.version('packaging'), '=='),
+                      packages)
+        self.assertEqual(len({package.canonical_name for package in packages}), len(packages))
+
+    def test_stdin(self):
+        stdin = io.StringIO('# frozen\nrequests==2.22.0\n-r other.txt\nsix\n')
+        with mock.patch('sys.stdin', stdin):
+            diff_packages, unique_packages, _ = _compare_reqs('-', self.requirements, use_processes=True, workers=2)
+        self.assertEqual(diff_packages[Package('requests', '2.22.0', '==')], ['<stdin>'])
+        self.assertEqual(diff_packages[Package('six')], ['<stdin>'])
+
+    def test_stdin_pep508(self):
+        with open(self.requirements, 'w') as f:
+            f.write('numpy<2.0,>=1.0\n')
+        for workers, use_processes in ((None, False), (2, True)):
+            with mock.patch('sys.stdin', io.StringIO('numpy>=1.0,<2.0\n')):
+                diff_packages, _, same_packages = _compare_reqs(
+                    '-', self.requirements, workers=workers, use_processes=use_processes, pep508=True
+                )
+            self.assertEqual(diff_packages, {})
+            self.assertEqual(list(same_packages.values()), [['<stdin>', self.requirements]])
+
+        with mock.patch('sys.stdin', io.StringIO('numpy>=1.0,<2.0\n')):
+            packages = asyncio.run(_load_packages_async(['-', self.requirements], pep508=True))
+        self.assertEqual(packages['<stdin>'], packages[self.requirements])
+
+
+class TestLoadPackages(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_files = ['tmp_requirements1.txt', 'tmp_requirements2.txt', 'tmp_requirements3.txt']
+        for idx, tmp_file in enumerate(self.tmp_files):
+            with open(tmp_file, 'w') as f:
+                f.write('requests==2.22.0' + '\n')
+                f.write(f'numpy==1.{idx}.0' + '\n')
+                f.write(f'only-in-{idx}' + '\n')
+
+    def tearDown(self):
+        for tmp_file in self.tmp_files:
+            os.remove(tmp_file)
+
+    def test_threads_keep_input_order(self):
+        serial = _load_packages(self.tmp_files)
+        threaded = _load_packages(self.tmp_files, workers=3)
+        self.assertEqual(list(threaded), self.tmp_files)
+        self.assertEqual(threaded, serial)
+
+    def test_processes_keep_input_order(self):
+        serial = _load_packages(self.tmp_files)
+        processed = _load_packages(self.tmp_files, workers=2, use_processes=True)
+        self.assertEqual(list(processed), self.tmp_files)
+        self.assertEqual(processed, serial)
+
+    def test_compare_with_workers(self):
+        self.assertEqual(_compare_reqs(*self.tmp_files, workers=3), _compare_reqs(*self.tmp_files))
+
+
+class TestPackage(unittest.TestCase):
+
+    def test_ordering(self):
+        packages = [
+            Package('numpy'),
+            Package('numpy', '1.10.0', '=='),
+            Package('django', '4.0', '>='),
+            Package('numpy', '1.9.0', '=='),
+        ]
+        self.assertEqual(sorted(packages), [
+            Package('django', '4.0', '>='),
+            Package('numpy', '1.9.0', '=='),
+            Package('numpy', '1.10.0', '=='),
+            Package('numpy'),
+        ])
+
+    def test_canonical_name(self):
+        self.assertEqual(canonical_name('Zope_Interface'), 'zope-interface')
+        self.assertEqual(canonical_name('zope.interface'), 'zope-interface')
+        self.assertEqual(canonical_name('ruamel.yaml.clib'), 'ruamel-yaml-clib')
+        self.assertEqual(Package('Django', '4.0', '==').canonical_name, 'django')
+        self.assertEqual(sorted([Package('flask'), Package('Django'), Package('django')])[:2],
+                         [Package('Django'), Package('django')])
+
+    def test_frozen_and_picklable(self):
+        package = Package('numpy', '1.19.2', '==')
+        with self.assertRaises(AttributeError):
+            package.version = '1.20.0'
+        self.assertEqual(pickle.loads(pickle.dumps(package)), package)
+        self.assertEqual(hash(pickle.loads(pickle.dumps(package))), hash(package))
+
+        package = Package('requests', '2.22.0', '==', ('socks',), 'os_name == "nt"')
+        self.assertEqual(pickle.loads(pickle.dumps(package)), package)
+        self.assertNotEqual(package, Package('requests', '2.22.0', '=='))
+        self.assertNotEqual(hash(package), hash(Package('requests', '2.22.0', '==')))
+
+    def test_extras_and_marker_only_stored_when_set(self):
+        plain = Package('requests', '2.22.0', '==')
+        marked = Package('requests', '2.22.0', '==', ('socks',), 'os_name == "nt"')
+        self.assertFalse(hasattr(plain, '__dict__'))
+        self.assertLess(sys.getsizeof(plain), sys.getsizeof(marked))
+        self.assertIsInstance(marked, Package)
+        self.assertEqual((plain.extras, plain.marker), ((), None))
+        self.assertEqual(plain.pin, ('2.22.0', '==', (), None))
+        self.assertEqual(marked.pin, ('2.22.0', '==', ('socks',), 'os_name == "nt"'))
+        self.assertEqual(Package('requests', '2.22.0', '==', []), plain)
+        with self.assertRaises(AttributeError):
+            marked.marker = None
+
+    def test_shares_parsed_versions(self):
+        first, second = Package('numpy', '1.19.2', '=='), Package('scipy', '1.19.2', '==')
+        self.assertIs(first.sort_key[3], second.sort_key[3])
+        self.assertIs(first.version, second.version)
+
+    def test_invalid_version_sorts_last(self):
+        packages = [Package('numpy', 'not a version', '=='), Package('numpy', '1.19.2', '==')]
+        self.assertEqual(sorted(packages)[0].version, '1.19.2')
+
+
+class TestSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tmp_files = [os.path.join(self.tmp_dir, f'requirements{idx}.txt') for idx in range(3)]
+        for idx, tmp_file in enumerate(self.tmp_files):
+            self._write(tmp_file, ['requests==2.22.0', f'numpy==1.{idx}.0', f'only-in-{idx}', 'six==1.16.0'])
+        self.snapshot_path = os.path.join(self.tmp_dir, 'snapshot.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, tmp_file, lines, mtime_ns=None):
+        with open(tmp_file, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        if mtime_ns is not None:
+            os.utime(tmp_file, ns=(mtime_ns, mtime_ns))
+
+    def test_incremental_matches_full_comparison(self):
+        store = SnapshotStore()
+        self.assertEqual(_compare_reqs(*self.tmp_files, snapshot=store), _compare_reqs(*self.tmp_files))
+
+        self._write(self.tmp_files[1], ['requests==2.28.0', 'numpy==1.0.0', 'six==1.16.0', 'pytest'], 10 ** 9)
+        self.assertEqual(_compare_reqs(*self.tmp_files, snapshot=store), _compare_reqs(*self.tmp_files))
+
+        self._write(self.tmp_files[1], ['requests==2.22.0', 'numpy==1.1.0', 'only-in-1', 'six==1.16.0'], 2 * 10 ** 9)
+        self.assertEqual(_compare_reqs(*self.tmp_files, snapshot=store), _compare_reqs(*self.tmp_files))
+
+    def test_only_changed_names_are_reclassified(self):
+        store = SnapshotStore()
+        _compare_reqs(*self.tmp_files, snapshot=store)
+        # same packages in another order plus one new line
+        lines = ['six==1.16.0', 'only-in-1', 'numpy==1.1.0', 'requests==2.22.0', 'pytest']
+        self._write(self.tmp_files[1], lines, 10 ** 9)
+
+        with mock.patch('compare_reqs._classify_entries', wraps=_classify_entries) as classify:
+            results = _compare_reqs(*self.tmp_files, snapshot=store)
+        self.assertEqual(classify.call_count, 1)
+        self.assertEqual(store.changes, ([], [('unique', Package('pytest'), self.tmp_files[1])]))
+        self.assertEqual(results, _compare_reqs(*self.tmp_files))
+
+    def test_unchanged_files_are_not_parsed(self):
+        _compare_reqs(*self.tmp_files, snapshot=self.snapshot_path)
+        self._write(self.tmp_files[2], ['requests==2.28.0'], 10 ** 9)
+
+        with mock.patch('compare_reqs.parse_requirements', wraps=parse_requirements) as parse:
+            results = _compare_reqs(*self.tmp_files, snapshot=self.snapshot_path)
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(parse.call_args[0], (self.tmp_files[2],))
+        self.assertEqual(results, _compare_reqs(*self.tmp_files))
+
+    def test_touched_file_with_same_content_is_not_parsed(self):
+        store = SnapshotStore()
+        _compare_reqs(*self.tmp_files, snapshot=store)
+        os.utime(self.tmp_files[0], ns=(10 ** 9, 10 ** 9))
+
+        with mock.patch('compare_reqs.parse_requirements') as parse:
+            _compare_reqs(*self.tmp_files, snapshot=store)
+        parse.assert_not_called()
+
+    def test_parser_change_reparses(self):
+        store = SnapshotStore()
+        _compare_reqs(*self.tmp_files, snapshot=store)
+        with mock.patch('compare_reqs.parse_requirements', wraps=parse_requirements) as parse:
+            results = _compare_reqs(*self.tmp_files, snapshot=store, pep508=True)
+        self.assertEqual(parse.call_count, 3)
+        self.assertEqual(results, _compare_reqs(*self.tmp_files, pep508=True))
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tmp_files = [os.path.join(self.tmp_dir, f'requirements{idx}.txt') for idx in range(3)]
+        for idx, tmp_file in enumerate(self.tmp_files):
+            self._write(tmp_file, ['requests==2.22.0', f'only-in-{idx}'])
+        self.now = 0.0
+        self.stream = io.StringIO()
+        self.watcher = Watcher(*self.tmp_files, show_unique=True, debounce=0.5, stream=self.stream,
+                               clock=lambda: self.now)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, tmp_file, lines):
+        with open(tmp_file, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def _output(self):
+        output = self.stream.getvalue()
+        self.stream.seek(0)
+        self.stream.truncate()
+        return output
+
+    def test_renders_only_changes(self):
+        self.assertTrue(self.watcher.check())
+        self.assertIn('only-in-0', self._output())
+        self.assertFalse(self.watcher.check())
+
+        self._write(self.tmp_files[1], ['requests==2.28.0', 'only-in-1'])
+        with mock.patch('compare_reqs.parse_requirements', wraps=parse_requirements) as parse:
+            self.assertFalse(self.watcher.check())
+            self.now += 1
+            self.assertTrue(self.watcher.check())
+        self.assertEqual([call[0][0] for call in parse.call_args_list], [self.tmp_files[1]])
+
+        changes = self._output().splitlines()
+        self.assertIn(f'+ diff   requests == 2.28.0             - {self.tmp_files[1]}', changes)
+        self.assertIn(f'+ diff   requests == 2.22.0             - {self.tmp_files[0]}', changes)
+        self.assertEqual(len(changes), 3)
+
+    def test_debounces_rapid_saves(self):
+        self.watcher.check()
+        self._output()
+        for version in ('2.23.0', '2.24.0', '2.25.0'):
+            self._write(self.tmp_files[0], [f'requests=={version}', 'only-in-0'])
+            os.utime(self.tmp_files[0], ns=(int(self.now * 10 ** 9), int(self.now * 10 ** 9)))
+            self.assertFalse(self.watcher.check())
+            self.now += 0.2
+            self.assertFalse(self.watcher.check())
+        self.assertEqual(self._output(), '')
+
+        self.now += 1
+        self.assertTrue(self.watcher.check())
+        self.assertIn('requests == 2.25.0', self._output())
+
+    def test_keeps_watching_after_errors(self):
+        self.watcher.check()
+        os.remove(self.tmp_files[2])
+        self.watcher.check()
+        self.now += 1
+        self.assertTrue(self.watcher.check())
+        self.assertIn('requirements2.txt', self._output())
+
+        self._write(self.tmp_files[2], ['requests==2.22.0', 'only-in-2'])
+        self.watcher.check()
+        self.now += 2
+        self.assertTrue(self.watcher.check())
+
+    def test_picks_up_missing_sources(self):
+        missing = os.path.join(self.tmp_dir, 'requirements3.txt')
+        watcher = Watcher(self.tmp_files[0], missing, show_unique=True, stream=self.stream, clock=lambda: self.now)
+        watcher.check()
+        self.assertIn('requirements3.txt', self._output())
+        self.assertFalse(watcher.check())
+
+        self._write(missing, ['requests==2.28.0'])
+        watcher.check()
+        self.now += 1
+        self.assertTrue(watcher.check())
+        output = self._output().splitlines()
+        self.assertIn(f'requests == 2.28.0             - {missing}', output)
+        self.assertIn(f'only-in-0                      - {self.tmp_files[0]}', output)
+
+    def test_filters_output(self):
+        watcher = Watcher(*self.tmp_files, show_unique=True, stream=self.stream, clock=lambda: self.now,
+                          names=['ONLY-*'], sources=[self.tmp_files[1]], limit=1)
+        watcher.check()
+        output = self._output()
+        self.assertIn('only-in-1', output)
+        self.assertNotIn('only-in-0', output)
+        self.assertNotIn('requests', output)
+
+        self._write(self.tmp_files[1], ['requests==2.28.0', 'only-in-1', 'only-in-a', 'only-in-b'])
+        self._write(self.tmp_files[0], ['requests==2.22.0', 'only-in-c'])
+        watcher.check()
+        self.now += 1
+        self.assertTrue(watcher.check())
+        self.assertEqual(self._output().splitlines(), [f'+ unique only-in-a                      - {self.tmp_files[1]}'])
+
+    def test_unknown_source(self):
+        with self.assertRaises(ValueError):
+            Watcher(*self.tmp_files, sources=[os.path.join(self.tmp_dir, 'other.txt')])
+
+
+class TestCompareReqsAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tmp_files = [os.path.join(self.tmp_dir, f'requirements{idx}.txt') for idx in range(4)]
+        for idx, tmp_file in enumerate(self.tmp_files):
+            with open(tmp_file, 'w') as f:
+                f.write(f'requests==2.2{idx % 2}.0\nonly-in-{idx}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_results_as_sync(self):
+        self.assertEqual(asyncio.run(_compare_reqs_async(*self.tmp_files)), _compare_reqs(*self.tmp_files))
+        stream = io.StringIO()
+        self.assertTrue(asyncio.run(compare_reqs_async(*self.tmp_files, output_format='json', stream=stream)))
+        self.assertEqual(json.loads(stream.getvalue())['records']['diff'], 4)
+        with self.assertRaises(ValueError):
+            asyncio.run(_compare_reqs_async(self.tmp_files[0]))
+
+    def _slow_establish(self, delay):
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+        urls = {f'http://example.com/{idx}/requirements.txt': path for idx, path in enumerate(self.tmp_files)}
+
+        def establish(directory, timeout=None):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(delay)
+            with lock:
+                state['active'] -= 1
+            return urls[directory]
+
+        return list(urls), establish, state
+
+    def test_limits_connections_per_host(self):
+        urls, establish, state = self._slow_establish(0.05)
+        with mock.patch('compare_reqs._establish_filepath', side_effect=establish):
+            packages = asyncio.run(_compare_reqs_async(*urls, host_connections=2))
+        self.assertEqual(state['peak'], 2)
+        self.assertEqual(packages[0][Package('requests', '2.20.0', '==')], [urls[0], urls[2]])
+
+    def test_timeout(self):
+        urls, establish, _ = self._slow_establish(0.5)
+        with mock.patch('compare_reqs._establish_filepath', side_effect=establish):
+            with self.assertRaisesRegex(ValueError, 'Timed out'):
+                asyncio.run(_compare_reqs_async(*urls, timeout=0.05))
+
+
+class TestOutputFormats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_files = ['tmp_requirements1.txt', 'tmp_requirements2.txt']
+        with open(self.tmp_files[0], 'w') as f:
+            f.write('requests==2.22.0' + '\n')
+            f.write('numpy==1.19.2' + '\n')
+            f.write('pandas' + '\n')
+        with open(self.tmp_files[1], 'w') as f:
+            f.write('requests==2.22.0' + '\n')
+            f.write('numpy>=1.22.2' + '\n')
+
+    def tearDown(self):
+        for tmp_file in self.tmp_files:
+            os.remove(tmp_file)
+
+    def _compare(self, output_format, **kwargs):
+        stream = io.StringIO()
+        self.assertTrue(compare_reqs(*self.tmp_files, output_format=output_format, stream=stream, **kwargs))
+        return stream.getvalue()
+
+    def test_jsonl(self):
+        records = [json.loads(line) for line in self._compare('jsonl').splitlines()]
+        self.assertEqual(records, [
+            {'category': 'diff', 'name': 'numpy', 'version_spec': '==', 'version': '1.19.2',
+             'source': 'tmp_requirements1.txt'},
+            {'category': 'diff', 'name': 'numpy', 'version_spec': '>=', 'version': '1.22.2',
+             'source': 'tmp_requirements2.txt'},
+        ])
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self._compare('csv', show_unique=True, show_same=True))))
+        self.assertEqual(rows[0], ['category', 'name', 'version_spec', 'version', 'source', 'extras', 'marker'])
+        self.assertEqual(len(rows), 6)
+        self.assertIn(['unique', 'pandas', '', '', 'tmp_requirements1.txt', '', ''], rows)
+        self.assertIn(['same', 'requests', '==', '2.22.0', 'tmp_requirements2.txt', '', ''], rows)
+
+    def test_csv_pep508(self):
+        with open(self.tmp_files[0], 'a') as f:
+            f.write('celery[redis,sqs]>=5.0; python_version >= "3.8"' + '\n')
+        rows = list(csv.reader(io.StringIO(self._compare('csv', show_unique=True, pep508=True))))
+        self.assertIn(
+            ['unique', 'celery', '>=', '5.0', 'tmp_requirements1.txt', 'redis,sqs', 'python_version >= "3.8"'], rows
+        )
+        records = [json.loads(line) for line in self._compare('jsonl', show_unique=True, pep508=True).splitlines()]
+        self.assertIn({'category': 'unique', 'name': 'celery', 'version_spec': '>=', 'version': '5.0',
+                       'source': 'tmp_requirements1.txt', 'extras': ['redis', 'sqs'],
+                       'marker': 'python_version >= "3.8"'}, records)
+
+    def test_json_summary(self):
+        summary = json.loads(self._compare('json', show_unique=True, show_same=True))
+        self.assertEqual(summary['records'], {'diff': 2, 'unique': 1, 'same': 2})
+        self.assertEqual(summary['packages'], {'diff': 1, 'unique': 1, 'same': 1})
+        self.assertEqual(summary['sources']['tmp_requirements1.txt'], {'diff': 1, 'unique': 1, 'same': 1})
+
+    def test_table_to_stream(self):
+        output = self._compare('table', remove_spaces=True)
+        self.assertIn('numpy==1.19.2', output)
+        self.assertIn('numpy>=1.22.2', output)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            compare_reqs(*self.tmp_files, output_format='xml')
+
+    def test_filtered_table(self):
+        output = self._compare('table', show_unique=True, show_same=True, remove_spaces=True, names=['NUM*'])
+        self.assertIn('numpy==1.19.2', output)
+        self.assertNotIn('requests', output)
+        self.assertNotIn('pandas', output)
+
+        output = self._compare('table', show_unique=True, show_same=True, names=[re.compile('^(pandas|requests)$')],
+                               sources=['tmp_requirements1.txt'])
+        self.assertIn('pandas', output)
+        self.assertIn('requests', output)
+        self.assertNotIn('numpy', output)
+
+        output = self._compare('table', remove_spaces=True, limit=1)
+        self.assertIn('numpy==1.19.2', output)
+        self.assertNotIn('numpy>=1.22.2', output)
+
+    def test_glob_matches_whole_name(self):
+        with open(self.tmp_files[0], 'a') as f:
+            f.write('pynumpy==1.0.0' + '\n')
+        records = [json.loads(line) for line in self._compare('jsonl', show_unique=True, names=['numpy']).splitlines()]
+        self.assertEqual({record['name'] for record in records}, {'numpy'})
+
+        records = [json.loads(line) for line in self._compare(
+            'jsonl', show_unique=True, names=[re.compile('numpy')]
+        ).splitlines()]
+        self.assertEqual({record['name'] for record in records}, {'numpy', 'pynumpy'})
+
+    def test_only_directory_sources(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for service, version in (('api', '1.0.0'), ('web', '2.0.0')):
+                os.makedirs(os.path.join(tmp_dir, service))
+                with open(os.path.join(tmp_dir, service, 'requirements.txt'), 'w') as f:
+                    f.write(f'requests=={version}\n')
+
+            directories = [os.path.join(tmp_dir, 'api'), os.path.join(tmp_dir, 'web')]
+            stream = io.StringIO()
+            with contextlib.redirect_stdout(stream):
+                main(['--format', 'jsonl', '--only', directories[0], *directories])
+            records = [json.loads(line) for line in stream.getvalue().splitlines()]
+            self.assertEqual([(record['version'], record['source']) for record in records],
+                             [('1.0.0', os.path.join(directories[0], 'requirements.txt'))])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_only_normalizes_paths(self):
+        stream = io.StringIO()
+        with contextlib.redirect_stdout(stream):
+            main(['--format', 'jsonl', '--only', os.path.join('.', self.tmp_files[1]), *self.tmp_files])
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([record['source'] for record in records], ['tmp_requirements2.txt'])
+
+        records = [json.loads(line) for line in self._compare(
+            'jsonl', sources=[os.path.abspath(self.tmp_files[0])]
+        ).splitlines()]
+        self.assertEqual([record['source'] for record in records], ['tmp_requirements1.txt'])
+
+    def test_only_unknown_source(self):
+        with self.assertRaises(ValueError):
+            compare_reqs(*self.tmp_files, sources=['tmp_requirements3.txt'], stream=io.StringIO())
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()) as stderr:
+            main(['--only', 'tmp_requirements3.txt', *self.tmp_files])
+        self.assertIn('tmp_requirements3.txt', stderr.getvalue())
+
+    def test_name_regex_ignores_case(self):
+        stream = io.StringIO()
+        with contextlib.redirect_stdout(stream):
+            main(['--format', 'jsonl', '--same', '--name-regex', 'REQ', *self.tmp_files])
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual({record['name'] for record in records}, {'requests'})
+
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            main(['--name-regex', '(', *self.tmp_files])
+
+    def test_filtered_jsonl(self):
+        records = [json.loads(line) for line in self._compare(
+            'jsonl', show_unique=True, show_same=True, sources=['tmp_requirements2.txt'], limit=2
+        ).splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual({record['source'] for record in records}, {'tmp_requirements2.txt'})
+
+    def test_filter_flags(self):
+        stream = io.StringIO()
+        with contextlib.redirect_stdout(stream):
+            main(['--format', 'jsonl', '--same', '--name', 'req*', '--only', 'tmp_requirements1.txt', *self.tmp_files])
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([(record['name'], record['source']) for record in records],
+                         [('requests', 'tmp_requirements1.txt')])
+
+
+class TestImportTime(unittest.TestCase):
+    # cumulative time in microseconds importing compare_reqs may take, generous
+    # enough for slow CI machines while still catching eager heavy imports
+    IMPORT_TIME_THRESHOLD_US = 100000
+    LAZY_MODULES = ('art', 'packaging', 'http.client', 'concurrent.futures', 'csv', 'asyncio')
+
+    def _import_times(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import compare_reqs'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+        import_times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or '[us]' in line:
+                continue
+            _, cumulative, module = line.split('|')
+            import_times[module.strip()] = int(cumulative)
+        return import_times
+
+    def test_heavy_dependencies_are_lazy(self):
+        import_times = self._import_times()
+        for module in self.LAZY_MODULES:
+            self.assertNotIn(module, import_times)
+
+    def test_import_time_threshold(self):
+        self.assertLess(self._import_times()['compare_reqs'], self.IMPORT_TIME_THRESHOLD_US)
+
+
+class TestCommandLine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for service, numpy_version in (('api', '1.19.2'), ('web', '1.22.2'), ('worker', '1.22.2')):
+            os.makedirs(os.path.join(self.tmp_dir, 'services', service))
+            with open(os.path.join(self.tmp_dir, 'services', service, 'requirements.txt'), 'w') as f:
+                f.write('requests==2.22.0' + '\n')
+                f.write(f'numpy=={numpy_version}' + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _main(self, *argv):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            status = main(list(argv))
+        return status, stdout.getvalue()
+
+    def test_glob_sources(self):
+        pattern = os.path.join(self.tmp_dir, 'services', '*', 'requirements*.txt')
+        status, output = self._main(pattern, '--format', 'jsonl', '--same')
+        records = [json.loads(line) for line in output.splitlines()]
+
+        self.assertEqual(status, 0)
+        self.assertEqual(len(records), 6)
+        self.assertEqual(len({record['source'] for record in records}), 3)
+
+    def test_listfile_sources(self):
+        listfile = os.path.join(self.tmp_dir, 'sources.txt')
+        with open(listfile, 'w') as f:
+            f.write('# services to compare' + '\n')
+            f.write(os.path.join(self.tmp_dir, 'services', 'api') + '\n')
+            f.write(os.path.join(self.tmp_dir, 'services', 'web') + '\n')
+
+        output_path = os.path.join(self.tmp_dir, 'output.csv')
+        status, _ = self._main(f'@{listfile}', '--format', 'csv', '--output', output_path)
+        with open(output_path, 'r') as f:
+            rows = list(csv.reader(f))
+
+        self.assertEqual(status, 0)
+        self.assertEqual([row[1] for row in rows[1:]], ['numpy', 'numpy'])
+
+    def test_unmatched_glob(self):
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            main([os.path.join(self.tmp_dir, 'missing', '*.txt'), os.path.join(self.tmp_dir, 'services', 'api')])
+
+    def test_watch_rejects_other_outputs(self):
+        api = os.path.join(self.tmp_dir, 'services', 'api')
+        web = os.path.join(self.tmp_dir, 'services', 'web')
+        for option in (['--format', 'jsonl'], ['--matrix'], ['--conflicts'], ['--stats']):
+            stderr = io.StringIO()
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(stderr):
+                main([api, web, '--watch'] + option)
+            self.assertIn(option[0], stderr.getvalue())
+
+    def test_watch_filters_output(self):
+        api = os.path.join(self.tmp_dir, 'services', 'api')
+        web = os.path.join(self.tmp_dir, 'services', 'web')
+        with mock.patch('compare_reqs.time.sleep', side_effect=KeyboardInterrupt):
+            status, output = self._main(api, web, '--watch', '--same', '--name', 'NUMPY', '--only', web)
+        self.assertEqual(status, 0)
+        self.assertIn(f"numpy == 1.22.2                - {os.path.join(web, 'requirements.txt')}", output)
+        self.assertNotIn('numpy == 1.19.2', output)
+        self.assertNotIn('requests', output)
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tmp_files = [os.path.join(self.tmp_dir, f'requirements{idx}.txt') for idx in range(2)]
+        for idx, tmp_file in enumerate(self.tmp_files):
+            with open(tmp_file, 'w') as f:
+                f.write('# pinned' + '\n')
+                f.write('requests==2.22.0' + '\n')
+                f.write(f'numpy==1.{idx}.0' + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_compare_collects_stats(self):
+        stats = Stats()
+        _compare_reqs(*self.tmp_files, stats=stats)
+
+        self.assertEqual(set(stats.stages), {'load', 'classify'})
+        self.assertEqual(list(stats.sources), self.tmp_files)
+        self.assertEqual(stats.lines_scanned, 6)
+        self.assertEqual(stats.packages_parsed, 4)
+        self.assertEqual(stats.bytes_read, sum(os.path.getsize(tmp_file) for tmp_file in self.tmp_files))
+        self.assertEqual(stats.comparisons, 2)
+        self.assertEqual(stats.records, 4)
+        json.dumps(stats.as_dict())
+
+    def test_mmap_counts_lines(self):
+        stats = Stats()
+        _compare_reqs(*self.tmp_files, stats=stats, use_mmap=True)
+        self.assertEqual(stats.lines_scanned, 6)
+
+    def test_empty_file_is_not_cached(self):
+        empty = os.path.join(self.tmp_dir, 'empty-requirements.txt')
+        open(empty, 'w').close()
+        for use_mmap in (False, True):
+            stats = Stats()
+            _compare_reqs(self.tmp_files[0], empty, stats=stats, use_mmap=use_mmap)
+            self.assertEqual(stats.sources[empty]['lines'], 0)
+            self.assertFalse(stats.sources[empty]['cached'])
+
+    def test_snapshot_marks_cached_sources(self):
+        store = SnapshotStore()
+        _compare_reqs(*self.tmp_files, snapshot=store)
+        stats = Stats()
+        _compare_reqs(*self.tmp_files, snapshot=store, stats=stats)
+        self.assertTrue(all(source['cached'] for source in stats.sources.values()))
+        self.assertEqual(stats.lines_scanned, 0)
+
+    def test_streaming_output_and_profile(self):
+        stats = Stats()
+        profile = os.path.join(self.tmp_dir, 'compare.prof')
+        compare_reqs(*self.tmp_files, output_format='jsonl', stream=io.StringIO(), stats=stats, profile=profile)
+
+        self.assertEqual(set(stats.stages), {'load', 'render'})
+        self.assertEqual(stats.records, 4)
+        self.assertTrue(os.path.getsize(profile) > 0)
+
+    def test_streaming_with_limit(self):
+        stats = Stats()
+        compare_reqs(*self.tmp_files, output_format='jsonl', stream=io.StringIO(), stats=stats, limit=1)
+        # both requests records are classified before the first numpy record is written
+        self.assertEqual(stats.records, 3)
+        self.assertEqual(stats.comparisons, 2)